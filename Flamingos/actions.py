@@ -23,6 +23,16 @@ class EscapeAction(Action):
         raise SystemExit()
 
 
+class DescendAction(Action):
+    def perform(self, engine: Engine, entity: Entity) -> None:
+        engine.descend()
+
+
+class AscendAction(Action):
+    def perform(self, engine: Engine, entity: Entity) -> None:
+        engine.ascend()
+
+
 class ActionWithDirection(Action):
     def __init__(self, dx: int, dy: int):
         super().__init__()
@@ -54,7 +64,10 @@ class MeleeAction(ActionWithDirection):
         if not target:
             return  # No entity to attack.
 
-        print(f"You kick the {target.name}, much to its annoyance!")
+        if entity is engine.player:
+            print(f"You kick the {target.name}, much to its annoyance!")
+        else:
+            print(f"The {entity.name} kicks you, much to your annoyance!")
 
 
 class MovementAction(ActionWithDirection):
@@ -65,7 +78,7 @@ class MovementAction(ActionWithDirection):
 
         if not engine.game_map.in_bounds(dest_x, dest_y):
             return  # Destination is out of bounds.
-        if not engine.game_map.tiles["walkable"][dest_x, dest_y]:
+        if not engine.game_map.walkable[dest_x, dest_y]:
             return  # Destination is blocked by a tile.
         if engine.game_map.get_blocking_entity_at_location(dest_x, dest_y):
             return  # Destination is blocked by an entity.
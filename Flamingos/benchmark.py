@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""Time the hot paths of the game and write the results as JSON.
+
+Covers dungeon generation, `Engine.update_fov`, `BumpAction.perform`, monster turns and
+`GameMap.render` into an off-screen console, with and without lights. Everything is seeded, so two runs measure the same work and
+their results can be compared with `--compare`, which fails if anything got slower.
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import tcod
+
+from actions import BumpAction
+from data_classes.lighting import LightSource
+from engine import Engine
+from generators import entity_factories
+from generators.procgen import bsp_rooms, generate_dungeon, random_rooms
+from main import MAP_HEIGHT, MAP_WIDTH, SCREEN_HEIGHT, SCREEN_WIDTH, new_game
+
+# (map width, map height, max rooms, room min size, room max size)
+DUNGEON_SIZES = [
+    (80, 50, 30, 6, 10),
+    (240, 160, 30, 15, 30),
+    (600, 400, 200, 6, 16),
+    (2000, 2000, 3000, 6, 16),
+]
+ENTITY_COUNTS = [0, 100, 1000, 5000]
+LIGHT_COUNTS = [10, 100, 500]
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+Result = Dict[str, object]
+
+
+def measure(name: str, params: Dict[str, object], run: Callable[[], Optional[float]], repeat: int,
+            setup: Optional[Callable[[], None]] = None, calls: int = 1) -> Result:
+    """Time `run` `repeat` times after a warm-up run, calling `setup` untimed before each, and return the seconds per call.
+
+    `run` may return the seconds it spent on the measured work itself, to leave its own preparation out.
+    """
+    samples = []
+    for i in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        elapsed = run()
+        if elapsed is None:
+            elapsed = time.perf_counter() - start
+        if i > 0:  # The first run only warms up caches.
+            samples.append(elapsed / calls)
+    return {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "calls": calls,
+        "median": statistics.median(samples),
+        "min": min(samples),
+    }
+
+
+def bench_generate(seed: int, repeat: int) -> List[Result]:
+    results = []
+    for width, height, max_rooms, room_min_size, room_max_size in DUNGEON_SIZES:
+        for placement in (random_rooms, bsp_rooms):
+            if placement is random_rooms and max_rooms > 200:
+                continue  # Rejection sampling is quadratic, it would dominate the run.
+
+            def run() -> None:
+                generate_dungeon(
+                    max_rooms=max_rooms,
+                    room_min_size=room_min_size,
+                    room_max_size=room_max_size,
+                    max_monsters_per_room=2,
+                    map_width=width,
+                    map_height=height,
+                    player=copy.deepcopy(entity_factories.player),
+                    rng=random.Random(seed),
+                    room_placement=placement,
+                )
+
+            params = {"width": width, "height": height, "max_rooms": max_rooms, "placement": placement.__name__}
+            results.append(measure("generate_dungeon", params, run, repeat))
+    return results
+
+
+def walk(steps: int, rng: random.Random) -> List[BumpAction]:
+    return [BumpAction(*rng.choice(DIRECTIONS)) for _ in range(steps)]
+
+
+def bench_fov(seed: int, repeat: int, steps: int) -> List[Result]:
+    engine = new_game(seed)
+    moves = walk(steps, random.Random(seed))
+    positions = []
+    for action in moves:
+        action.perform(engine, engine.player)
+        positions.append((engine.player.x, engine.player.y))
+
+    def run() -> None:
+        for x, y in positions:
+            engine.game_map.move_entity(engine.player, x, y)
+            engine.update_fov()
+
+    return [measure("update_fov", {"steps": steps}, run, repeat, calls=steps)]
+
+
+def populate(engine: Engine, count: int, rng: random.Random) -> None:
+    """Replace the monsters on the map with `count` orcs on random free floor tiles."""
+    game_map = engine.game_map
+    for entity in list(game_map.entities):
+        if entity is not engine.player:
+            game_map.remove_entity(entity)
+    floor = [tuple(xy) for xy in np.argwhere(game_map.walkable).tolist() if tuple(xy) != (engine.player.x, engine.player.y)]
+    for x, y in rng.sample(floor, min(count, len(floor))):
+        entity_factories.orc.spawn(game_map, x, y)
+
+
+def bench_bump(seed: int, repeat: int, steps: int) -> List[Result]:
+    results = []
+    for count in ENTITY_COUNTS:
+        engine = new_game(seed)
+        populate(engine, count, random.Random(seed))
+        start = (engine.player.x, engine.player.y)
+        moves = walk(steps, random.Random(seed))
+
+        def setup() -> None:
+            engine.game_map.move_entity(engine.player, *start)
+
+        def run() -> None:
+            for action in moves:
+                action.perform(engine, engine.player)
+
+        with contextlib.redirect_stdout(io.StringIO()):  # Bumping into orcs prints a message.
+            results.append(measure("BumpAction.perform", {"entities": count, "steps": steps}, run, repeat, setup, steps))
+    return results
+
+
+def bench_enemy_turns(seed: int, repeat: int, steps: int) -> List[Result]:
+    results = []
+    for count in ENTITY_COUNTS:
+        game = new_game(seed)
+        populate(game, count, random.Random(seed))
+        snapshot = [(entity, entity.x, entity.y) for entity in game.game_map.entities]
+        # Wake everything, every monster on the map acts every turn.
+        engine = Engine(game.event_handler, game.game_map, game.player, activation_radius=max(MAP_WIDTH, MAP_HEIGHT))
+
+        def setup() -> None:
+            for entity, x, y in snapshot:
+                engine.game_map.move_entity(entity, x, y)
+
+        def run() -> None:
+            for _ in range(steps):
+                engine.handle_enemy_turns()
+
+        with contextlib.redirect_stdout(io.StringIO()):  # Monsters reaching the player print a message.
+            results.append(measure("Engine.handle_enemy_turns", {"entities": count, "turns": steps}, run, repeat, setup, steps))
+    return results
+
+
+def bench_render(seed: int, repeat: int, steps: int) -> List[Result]:
+    results = []
+    for scrolling in (False, True):
+        engine = new_game(seed)
+        console = tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+        start = (engine.player.x, engine.player.y)
+        moves = walk(steps, random.Random(seed))
+        positions = []
+        for action in moves:
+            action.perform(engine, engine.player)
+            positions.append((engine.player.x, engine.player.y))
+
+        def run() -> float:
+            render_time = 0.0
+            for x, y in positions:
+                if scrolling:
+                    engine.game_map.move_entity(engine.player, x, y)
+                    engine.update_fov()
+                begin = time.perf_counter()
+                engine.game_map.render(console, engine.player)
+                render_time += time.perf_counter() - begin
+            return render_time  # Moving the player and its FOV don't count.
+
+        def setup() -> None:
+            engine.game_map.move_entity(engine.player, *start)
+            engine.update_fov()
+
+        results.append(measure("GameMap.render", {"scrolling": scrolling, "frames": steps}, run, repeat, setup, steps))
+    return results
+
+
+def bench_lights(seed: int, repeat: int, steps: int) -> List[Result]:
+    results = []
+    for count in LIGHT_COUNTS:
+        for dynamic in (False, True):
+            engine = new_game(seed)
+            console = tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+            rng = random.Random(seed)
+            lighting = engine.game_map.lighting
+            floor = np.argwhere(engine.game_map.walkable).tolist()
+            for x, y in rng.sample(floor, count):
+                light = LightSource(x, y, radius=rng.randint(3, 8), color=(rng.randrange(256), rng.randrange(256), 128))
+                (lighting.add_dynamic_light if dynamic else lighting.add_static_light)(light)
+            moves = walk(steps, random.Random(seed))
+            start = (engine.player.x, engine.player.y)
+
+            def setup() -> None:
+                engine.game_map.move_entity(engine.player, *start)
+                engine.update_fov()
+
+            def run() -> float:
+                render_time = 0.0
+                for action in moves:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        engine.handle_action(action)
+                    if dynamic:
+                        for light in lighting.dynamic_lights:  # Flicker between two radii, like torches.
+                            light.radius = 11 - light.radius
+                    begin = time.perf_counter()
+                    engine.game_map.render(console, engine.player)
+                    render_time += time.perf_counter() - begin
+                return render_time
+
+            params = {"lights": count, "dynamic": dynamic, "frames": steps}
+            results.append(measure("GameMap.render lit", params, run, repeat, setup, steps))
+    return results
+
+
+def compare(results: List[Result], baseline_path: str, tolerance: float) -> bool:
+    """Print how `results` compare to an earlier run, returning False if anything got slower than `tolerance`."""
+    with open(baseline_path) as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    ok = True
+    for result in results:
+        old = baseline.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if old is None:
+            continue
+        ratio = result["median"] / old["median"] if old["median"] else 1.0
+        regressed = ratio > 1.0 + tolerance
+        ok = ok and not regressed
+        print(f"{'SLOWER' if regressed else 'ok':6} {ratio:6.2f}x  {result['name']} {result['params']}", file=sys.stderr)
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark generation, FOV, movement and rendering.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the dungeons and the walks.")
+    parser.add_argument("--repeat", type=int, default=5, help="Times each benchmark is run, the median is reported.")
+    parser.add_argument("--steps", type=int, default=200, help="Player moves per FOV, movement and render run.")
+    parser.add_argument("--output", default=None, help="Write the results to this file instead of stdout.")
+    parser.add_argument("--compare", default=None, help="Results of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown allowed by --compare, 0.2 is 20%%.")
+    args = parser.parse_args()
+
+    results = (
+        bench_generate(args.seed, args.repeat)
+        + bench_fov(args.seed, args.repeat, args.steps)
+        + bench_bump(args.seed, args.repeat, args.steps)
+        + bench_enemy_turns(args.seed, args.repeat, args.steps)
+        + bench_render(args.seed, args.repeat, args.steps)
+        + bench_lights(args.seed, args.repeat, args.steps)
+    )
+    report = {
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "tcod": tcod.__version__,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
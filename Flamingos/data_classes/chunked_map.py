@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+from tcod.console import Console
+
+from data_classes import tile_types
+from data_classes.game_map import GameMap
+
+if TYPE_CHECKING:
+    from data_classes.entity import Entity
+
+CHUNK_SIZE = 64
+
+# Layers that come from the chunk generator, the others start out filled with their default value.
+GENERATED_LAYERS = ("tiles", "is_floor")
+
+# Builds one chunk as a dense CHUNK_SIZE x CHUNK_SIZE map in chunk-local coordinates: (chunk_x, chunk_y) -> GameMap.
+ChunkGenerator = Callable[[int, int], GameMap]
+
+Key = Tuple[Union[int, slice], Union[int, slice]]
+
+
+def _to_range(index: Union[int, slice], length: int) -> Tuple[int, int]:
+    if isinstance(index, slice):
+        start, stop, step = index.indices(length)
+        if step != 1:
+            raise IndexError("Chunked layers only support slices with a step of 1.")
+        return start, max(start, stop)
+    index = int(index)
+    if not 0 <= index < length:
+        raise IndexError(f"Index {index} is out of bounds for a layer of length {length}.")
+    return index, index + 1
+
+
+class ChunkedArray:
+    """One per-tile layer of a `ChunkedGameMap`, stored as CHUNK_SIZE² blocks that only exist once needed.
+
+    Indexing with ints or slices behaves like a dense 2D array, reads return copies and writes go
+    through to the chunks.
+    """
+
+    def __init__(self, owner: ChunkedGameMap, name: str, fill_value: np.ndarray):
+        self.owner = owner
+        self.name = name
+        self.fill_value = np.asarray(fill_value)
+        self.dtype = self.fill_value.dtype
+        self.shape = (owner.width, owner.height)
+        self.chunks: Dict[Tuple[int, int], np.ndarray] = {}
+        self.dirty: Set[Tuple[int, int]] = set()  # Chunks written to since they were generated or loaded
+        self.spilled: Set[Tuple[int, int]] = set()  # Chunks with a file in the owners spill_dir
+
+    def new_chunk(self) -> np.ndarray:
+        return np.full((CHUNK_SIZE, CHUNK_SIZE), fill_value=self.fill_value, order="F")
+
+    def get_chunk(self, chunk_key: Tuple[int, int], create: bool) -> Optional[np.ndarray]:
+        """Return a chunk, loading or generating it as needed.
+
+        Returns None for a chunk that was never written to unless `create` is True.
+        """
+        self.owner.touch(chunk_key)
+        chunk = self.chunks.get(chunk_key)
+        if chunk is None:
+            chunk = self.owner.load_chunk(self, chunk_key, create)
+        return chunk
+
+    def _blocks(self, x1: int, y1: int, x2: int, y2: int) -> Iterator[Tuple[Tuple[int, int], Tuple[slice, slice], Tuple[slice, slice]]]:
+        """Yield (chunk key, index into the window, index into the chunk) for every chunk overlapping the window."""
+        for chunk_x in range(x1 // CHUNK_SIZE, (x2 - 1) // CHUNK_SIZE + 1):
+            left = chunk_x * CHUNK_SIZE
+            bx1, bx2 = max(x1, left), min(x2, left + CHUNK_SIZE)
+            for chunk_y in range(y1 // CHUNK_SIZE, (y2 - 1) // CHUNK_SIZE + 1):
+                top = chunk_y * CHUNK_SIZE
+                by1, by2 = max(y1, top), min(y2, top + CHUNK_SIZE)
+                yield (
+                    (chunk_x, chunk_y),
+                    (slice(bx1 - x1, bx2 - x1), slice(by1 - y1, by2 - y1)),
+                    (slice(bx1 - left, bx2 - left), slice(by1 - top, by2 - top)),
+                )
+
+    def __getitem__(self, key: Key) -> np.ndarray:
+        x_index, y_index = key
+        x1, x2 = _to_range(x_index, self.shape[0])
+        y1, y2 = _to_range(y_index, self.shape[1])
+
+        out = np.empty((x2 - x1, y2 - y1), dtype=self.dtype, order="F")
+        if out.size:
+            for chunk_key, window_index, chunk_index in self._blocks(x1, y1, x2, y2):
+                chunk = self.get_chunk(chunk_key, create=False)
+                out[window_index] = self.fill_value if chunk is None else chunk[chunk_index]
+        # Integer indices drop their axis, like they do on a NumPy array.
+        return out[0 if not isinstance(x_index, slice) else slice(None), 0 if not isinstance(y_index, slice) else slice(None)]
+
+    def __setitem__(self, key: Key, value: np.ndarray) -> None:
+        x_index, y_index = key
+        x1, x2 = _to_range(x_index, self.shape[0])
+        y1, y2 = _to_range(y_index, self.shape[1])
+        if x1 == x2 or y1 == y2:
+            return
+        value = np.asarray(value, dtype=self.dtype)
+        if not isinstance(x_index, slice) and value.ndim == 1:
+            value = value[np.newaxis, :]  # Restore the dropped axis of row and column writes.
+        elif not isinstance(y_index, slice) and value.ndim == 1:
+            value = value[:, np.newaxis]
+        value = np.broadcast_to(value, (x2 - x1, y2 - y1))
+
+        for chunk_key, window_index, chunk_index in self._blocks(x1, y1, x2, y2):
+            chunk = self.get_chunk(chunk_key, create=True)
+            chunk[chunk_index] = value[window_index]
+            self.dirty.add(chunk_key)
+
+
+class PaletteView:
+    """Looks up one palette field, such as "walkable", for the tile ids read from a chunked `tiles` layer."""
+
+    def __init__(self, tiles: ChunkedArray, name: str):
+        self.tiles = tiles
+        self.name = name
+
+    def __getitem__(self, key: Key) -> np.ndarray:
+        return np.take(tile_types.tile_palette[self.name], self.tiles[key])
+
+
+class ChunkedGameMap(GameMap):
+    """A GameMap for very large worlds, generated a chunk at a time as the camera gets near.
+
+    Engine code indexes it like a dense map. At most `max_hot_chunks` chunks are kept in memory,
+    least recently used chunks are evicted first: generated data that wasn't changed is simply
+    regenerated when needed again, anything else is spilled to .npy files in `spill_dir` and
+    memory-mapped back in.
+    """
+
+    def __init__(
+            self,
+            width: int,
+            height: int,
+            generator: ChunkGenerator,
+            max_hot_chunks: int = 64,
+            spill_dir: Optional[str] = None,
+            entities: Iterable[Entity] = (),
+    ):
+        self.generator = generator
+        self.max_hot_chunks = max_hot_chunks
+        self.hot_chunks: OrderedDict[Tuple[int, int], None] = OrderedDict()
+        self.populated: Set[Tuple[int, int]] = set()  # Chunks that have been generated at least once
+        self.layers: List[ChunkedArray] = []
+        self._spill_directory = None
+        if spill_dir is None:
+            self._spill_directory = tempfile.TemporaryDirectory(prefix="flamingos-chunks-")
+            spill_dir = self._spill_directory.name
+        self.spill_dir = spill_dir
+        super().__init__(width, height, entities)
+
+    def new_layer(self, name: str, fill_value: np.ndarray) -> ChunkedArray:
+        layer = ChunkedArray(self, name, fill_value)
+        self.layers.append(layer)
+        return layer
+
+    def tile_property(self, name: str) -> PaletteView:
+        # Gathering the whole world isn't an option, look properties up for the requested tiles only.
+        return PaletteView(self.tiles, name)
+
+    def spill_path(self, layer: ChunkedArray, chunk_key: Tuple[int, int]) -> str:
+        return os.path.join(self.spill_dir, f"{layer.name}_{chunk_key[0]}_{chunk_key[1]}.npy")
+
+    def touch(self, chunk_key: Tuple[int, int]) -> None:
+        """Mark a chunk as recently used, evicting the coldest chunks if there are too many."""
+        if chunk_key in self.hot_chunks:
+            self.hot_chunks.move_to_end(chunk_key)
+            return
+        self.hot_chunks[chunk_key] = None
+        while len(self.hot_chunks) > self.max_hot_chunks:
+            self.evict(next(iter(self.hot_chunks)))
+
+    def load_chunk(self, layer: ChunkedArray, chunk_key: Tuple[int, int], create: bool) -> Optional[np.ndarray]:
+        if chunk_key in layer.spilled:
+            layer.chunks[chunk_key] = np.load(self.spill_path(layer, chunk_key), mmap_mode="r+")
+        elif layer.name in GENERATED_LAYERS:
+            self.generate_chunk(chunk_key)
+        elif create:
+            layer.chunks[chunk_key] = layer.new_chunk()
+        else:
+            return None
+        return layer.chunks[chunk_key]
+
+    def generate_chunk(self, chunk_key: Tuple[int, int]) -> None:
+        """Run the generator for a chunk, filling in the generated layers that aren't loaded or spilled."""
+        chunk_map = self.generator(*chunk_key)
+        for layer in self.layers:
+            if layer.name not in GENERATED_LAYERS or chunk_key in layer.chunks:
+                continue
+            if chunk_key not in layer.spilled:
+                layer.chunks[chunk_key] = np.asfortranarray(getattr(chunk_map, layer.name))
+
+        if chunk_key not in self.populated:
+            # Only the first time, regenerating an evicted chunk mustn't bring its monsters back.
+            self.populated.add(chunk_key)
+            left, top = chunk_key[0] * CHUNK_SIZE, chunk_key[1] * CHUNK_SIZE
+            self.total_discoverable_tiles += np.count_nonzero(chunk_map.is_floor[:self.width - left, :self.height - top])
+            store = chunk_map.entity_store
+            for row in store.live_rows().tolist():
+                x, y = int(store.x[row]) + left, int(store.y[row]) + top
+                if self.in_bounds(x, y):
+                    self.spawn_row(store, row, x, y)
+
+    def evict(self, chunk_key: Tuple[int, int]) -> None:
+        """Drop a chunk from memory, spilling the layers that can't be regenerated."""
+        del self.hot_chunks[chunk_key]
+        for layer in self.layers:
+            chunk = layer.chunks.pop(chunk_key, None)
+            dirty = chunk_key in layer.dirty
+            layer.dirty.discard(chunk_key)
+            if chunk is None:
+                continue
+            path = self.spill_path(layer, chunk_key)
+            if layer.name not in GENERATED_LAYERS and not np.any(chunk != layer.fill_value):
+                del chunk
+                if chunk_key in layer.spilled:
+                    layer.spilled.discard(chunk_key)
+                    os.remove(path)  # Back to its default value, nothing to keep.
+            elif isinstance(chunk, np.memmap):
+                chunk.flush()  # Already backed by its spill file.
+            elif dirty:
+                np.save(path, chunk)
+                layer.spilled.add(chunk_key)
+
+    def update_camera_points(self, console: Console, player: Entity) -> None:
+        super().update_camera_points(console, player)
+        # Generate the chunks around the camera ahead of time, one chunk beyond each edge.
+        x1 = max(self.camera_top_x - CHUNK_SIZE, 0)
+        y1 = max(self.camera_top_y - CHUNK_SIZE, 0)
+        x2 = min(self.camera_bottom_x + CHUNK_SIZE, self.width)
+        y2 = min(self.camera_bottom_y + CHUNK_SIZE, self.height)
+        for chunk_key, _, _ in self.tiles._blocks(x1, y1, x2, y2):
+            self.tiles.get_chunk(chunk_key, create=False)
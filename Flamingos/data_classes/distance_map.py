@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+import tcod.path
+
+if TYPE_CHECKING:
+    from data_classes.game_map import GameMap
+
+# Steps a monster may take, in order of preference when several are equally good.
+DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+_STAY_AND_DIRECTIONS = np.array(((0, 0),) + DIRECTIONS, dtype=np.int32)
+
+
+class DistanceMap:
+    """Walking distance to a goal (the player) for every tile in a window around it.
+
+    One field is shared by every monster hunting the goal, and it is only recomputed when
+    the goal moves or the map's tiles change (`GameMap.revision`).
+    """
+
+    def __init__(self, game_map: GameMap, radius: int = 32):
+        self.game_map = game_map
+        self.radius = radius
+        self.window: Tuple[slice, slice] = (slice(0, 0), slice(0, 0))
+        self.distance = np.zeros((0, 0), dtype=np.int32)
+        self.unreachable = np.iinfo(np.int32).max
+        self._key: Optional[Tuple[int, int, int]] = None
+
+    def update(self, goal_x: int, goal_y: int) -> None:
+        """Make the field point at (goal_x, goal_y), recomputing it only if anything changed."""
+        key = (goal_x, goal_y, self.game_map.revision)
+        if key == self._key:
+            return
+        self._key = key
+
+        self.window = self.game_map.window_around(goal_x, goal_y, self.radius)
+        x_slice, y_slice = self.window
+        cost = self.game_map.walkable[self.window].astype(np.int8)
+        self.distance = tcod.path.maxarray(cost.shape, dtype=np.int32, order="F")
+        self.distance[goal_x - x_slice.start, goal_y - y_slice.start] = 0
+        tcod.path.dijkstra2d(self.distance, cost, 1, None, out=self.distance)
+
+    def distance_at(self, x: int, y: int) -> int:
+        """Return the distance from (x, y) to the goal, `unreachable` outside the window or behind walls."""
+        x_slice, y_slice = self.window
+        if not (x_slice.start <= x < x_slice.stop and y_slice.start <= y < y_slice.stop):
+            return self.unreachable
+        return int(self.distance[x - x_slice.start, y - y_slice.start])
+
+    def next_step(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """Return the (dx, dy) that brings (x, y) closest to the goal, or None if no step gets closer."""
+        best = self.distance_at(x, y)
+        step = None
+        for dx, dy in DIRECTIONS:
+            distance = self.distance_at(x + dx, y + dy)
+            if distance < best:
+                best = distance
+                step = (dx, dy)
+        return step
+
+    def distances_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """`distance_at` for arrays of positions."""
+        x_slice, y_slice = self.window
+        local_x, local_y = xs - x_slice.start, ys - y_slice.start
+        inside = (local_x >= 0) & (local_x < self.distance.shape[0]) & (local_y >= 0) & (local_y < self.distance.shape[1])
+        distances = np.full(xs.shape, self.unreachable, dtype=np.int32)
+        distances[inside] = self.distance[local_x[inside], local_y[inside]]
+        return distances
+
+    def next_steps(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """`next_step` for arrays of positions. Returns dx, dy and a mask of the positions that have a step."""
+        candidates = _STAY_AND_DIRECTIONS[np.newaxis, :, :]
+        distances = self.distances_at(xs[:, np.newaxis] + candidates[..., 0], ys[:, np.newaxis] + candidates[..., 1])
+        # argmin picks the first of equally good steps, staying put wins unless a step gets strictly closer.
+        best = np.argmin(distances, axis=1)
+        steps = _STAY_AND_DIRECTIONS[best]
+        return steps[:, 0], steps[:, 1], best != 0
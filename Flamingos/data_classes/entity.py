@@ -1,15 +1,25 @@
 from __future__ import annotations
 
-import copy
-from typing import Tuple, TypeVar, TYPE_CHECKING
+from typing import Optional, Tuple, Type, TypeVar, TYPE_CHECKING
+
+from data_classes.entity_store import EntityStore
+from data_classes.render_order import RenderOrder
 
 if TYPE_CHECKING:
-    from game_map import GameMap
+    from data_classes.game_map import GameMap
 
 T = TypeVar("T", bound="Entity")
 
 
 class Entity:
+    """A handle onto one row of an `EntityStore`.
+
+    Entities on a map live in that map's store, other entities (like the templates in
+    `entity_factories`) each own a single row store. A row has at most one handle, so
+    handles can be compared by identity.
+    """
+    __slots__ = ("store", "index")
+
     def __init__(
             self,
             x: int = 0,
@@ -18,22 +28,129 @@ class Entity:
             color: Tuple[int, int, int] = (255, 255, 255),
             name: str = "<Unnamed>",
             blocks_movement: bool = False,
+            speed: int = 100,
+            render_order: RenderOrder = RenderOrder.ITEM,
     ):
-        self.x = x
-        self.y = y
-        self.char = char
-        self.color = color
-        self.name = name
-        self.blocks_movement = blocks_movement
+        self.store = EntityStore(capacity=1)
+        self.index = self.store.insert(self, x, y, char, color, name, blocks_movement, speed, render_order)
+
+    @classmethod
+    def for_row(cls: Type[T], store: EntityStore, row: int) -> T:
+        """Return the handle of a row of `store`, creating it if the row doesn't have one yet."""
+        handle = store.handles[row]
+        if handle is None:
+            handle = object.__new__(cls)
+            handle.store = store
+            handle.index = row
+            store.handles[row] = handle
+        return handle
+
+    @property
+    def gamemap(self) -> Optional[GameMap]:
+        return self.store.game_map
+
+    @property
+    def x(self) -> int:
+        return int(self.store.x[self.index])
+
+    @x.setter
+    def x(self, value: int) -> None:
+        if self.gamemap is not None:
+            self.gamemap.move_entity(self, value, self.y)  # Keeps the occupancy index in sync.
+        else:
+            self.store.x[self.index] = value
+
+    @property
+    def y(self) -> int:
+        return int(self.store.y[self.index])
+
+    @y.setter
+    def y(self, value: int) -> None:
+        if self.gamemap is not None:
+            self.gamemap.move_entity(self, self.x, value)
+        else:
+            self.store.y[self.index] = value
+
+    @property
+    def char(self) -> str:
+        return chr(self.store.ch[self.index])
+
+    @char.setter
+    def char(self, value: str) -> None:
+        self.store.ch[self.index] = ord(value)
+
+    @property
+    def color(self) -> Tuple[int, int, int]:
+        r, g, b = self.store.fg[self.index].tolist()
+        return r, g, b
+
+    @color.setter
+    def color(self, value: Tuple[int, int, int]) -> None:
+        self.store.fg[self.index] = value
+
+    @property
+    def name(self) -> str:
+        return self.store.names[self.index]
+
+    @name.setter
+    def name(self, value: str) -> None:
+        self.store.names[self.index] = value
+
+    @property
+    def blocks_movement(self) -> bool:
+        return bool(self.store.blocks_movement[self.index])
+
+    @blocks_movement.setter
+    def blocks_movement(self, value: bool) -> None:
+        self.store.blocks_movement[self.index] = value
+
+    @property
+    def speed(self) -> int:
+        return int(self.store.speed[self.index])
+
+    @speed.setter
+    def speed(self, value: int) -> None:
+        self.store.speed[self.index] = value
+
+    @property
+    def render_order(self) -> RenderOrder:
+        return RenderOrder(self.store.render_order[self.index])
+
+    @render_order.setter
+    def render_order(self, value: RenderOrder) -> None:
+        self.store.render_order[self.index] = value
+
+    def __deepcopy__(self: T, memo: dict) -> T:
+        """Copy this entity into a store of its own, off any map."""
+        clone = object.__new__(type(self))
+        clone.store = EntityStore(capacity=1)
+        clone.index = clone.store.copy_row(clone, self.store, self.index)
+        return clone
+
+    def move_to_store(self, store: EntityStore) -> None:
+        """Move this entity's row into `store`, freeing the old row."""
+        if store is self.store:
+            return
+        old_store, old_index = self.store, self.index
+        self.index = store.copy_row(self, old_store, old_index)
+        self.store = store
+        old_store.free(old_index)
 
     def spawn(self: T, gamemap: GameMap, x: int, y: int) -> T:
         """Spawn a copy of this instance at the given location."""
-        clone = copy.deepcopy(self)
-        clone.x = x
-        clone.y = y
-        gamemap.entities.add(clone)
-        return clone
+        return type(self).for_row(gamemap.entity_store, gamemap.spawn(self, x, y))
+
+    def place(self, x: int, y: int, gamemap: GameMap) -> None:
+        """Place this entity at a new location. Handles moving across GameMaps."""
+        if self.gamemap is not None:
+            self.gamemap.remove_entity(self)
+        self.x = x
+        self.y = y
+        gamemap.add_entity(self)
 
     def move(self, dx: int, dy: int) -> None:
-        self.x += dx
-        self.y += dy
+        if self.gamemap is not None:
+            self.gamemap.move_entity(self, self.x + dx, self.y + dy)
+        else:
+            self.x += dx
+            self.y += dy
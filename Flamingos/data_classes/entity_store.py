@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from data_classes.entity import Entity
+    from data_classes.game_map import GameMap
+
+# Per-entity data kept as one NumPy column each: (name, dtype, shape of one row).
+# New columns also need to be copied in `EntityStore.spawn_row` and `EntityStore.insert_many`.
+COLUMNS: Tuple[Tuple[str, type, Tuple[int, ...]], ...] = (
+    ("x", np.int32, ()),
+    ("y", np.int32, ()),
+    ("ch", np.int32, ()),  # Unicode codepoint.
+    ("fg", np.uint8, (3,)),  # RGB color.
+    ("blocks_movement", np.bool_, ()),
+    ("speed", np.int16, ()),  # Energy gained per game tick, 100 is normal speed.
+    ("render_order", np.int8, ()),  # `RenderOrder` layer, higher is drawn on top.
+    ("next_at", np.int32, ()),  # Next row on the same tile, -1 for the last one. Kept up to date by the GameMap.
+    ("alive", np.bool_, ()),  # False for rows that are free to be reused.
+)
+
+
+class EntityStore:
+    """Struct-of-arrays storage for entities. `Entity` objects are handles onto one row of a store.
+
+    Rows are never moved once handed out, removed rows go on a free list and get reused.
+    Handles are only created for rows something asks for, see `Entity.for_row`, so most
+    monsters are nothing but their row.
+    """
+
+    def __init__(self, capacity: int = 64, game_map: Optional[GameMap] = None):
+        self.capacity = max(capacity, 1)
+        self.game_map = game_map  # The map whose entities these are, None for entities off any map.
+        self.size = 0  # Rows in use or on the free list, live rows are all below this.
+        for name, dtype, shape in COLUMNS:
+            setattr(self, name, np.zeros((self.capacity, *shape), dtype=dtype))
+        self.names: List[Optional[str]] = [None] * self.capacity
+        self.handles: List[Optional[Entity]] = [None] * self.capacity
+        self.free_rows: List[int] = []
+
+    def __len__(self) -> int:
+        return self.size - len(self.free_rows)
+
+    def _grow(self) -> None:
+        self.capacity *= 2
+        for name, _, _ in COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((self.capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.names.extend([None] * (self.capacity - len(self.names)))
+        self.handles.extend([None] * (self.capacity - len(self.handles)))
+
+    def _allocate(self) -> int:
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.size == self.capacity:
+            self._grow()
+        self.size += 1
+        return self.size - 1
+
+    def insert(
+            self,
+            handle: Optional[Entity],
+            x: int,
+            y: int,
+            char: str,
+            color: Tuple[int, int, int],
+            name: str,
+            blocks_movement: bool,
+            speed: int = 100,
+            render_order: int = 0,
+    ) -> int:
+        """Add a row for `handle`, if it has one yet, and return its index."""
+        row = self._allocate()
+        self.x[row] = x
+        self.y[row] = y
+        self.ch[row] = ord(char)
+        self.fg[row] = color
+        self.blocks_movement[row] = blocks_movement
+        self.speed[row] = speed
+        self.render_order[row] = render_order
+        self.next_at[row] = -1
+        self.alive[row] = True
+        self.names[row] = name
+        self.handles[row] = handle
+        return row
+
+    def insert_many(
+            self,
+            x: np.ndarray,
+            y: np.ndarray,
+            ch: np.ndarray,
+            fg: np.ndarray,
+            names: List[str],
+            blocks_movement: np.ndarray,
+            speed: np.ndarray,
+            render_order: np.ndarray,
+    ) -> np.ndarray:
+        """Add rows for many entities at once and return their indices.
+
+        Every column is assigned by slice and no handles are created, ask `Entity.for_row` for the ones needed.
+        """
+        count = len(x)
+        while self.size + count > self.capacity:
+            self._grow()
+        rows = slice(self.size, self.size + count)
+        self.x[rows] = x
+        self.y[rows] = y
+        self.ch[rows] = ch
+        self.fg[rows] = fg
+        self.blocks_movement[rows] = blocks_movement
+        self.speed[rows] = speed
+        self.render_order[rows] = render_order
+        self.next_at[rows] = -1
+        self.alive[rows] = True
+        self.names[rows] = names
+        self.size += count
+        return np.arange(rows.start, rows.stop)
+
+    def copy_row(self, handle: Optional[Entity], source: EntityStore, source_row: int) -> int:
+        """Copy a row from another (or the same) store into a new row owned by `handle`."""
+        return self.spawn_row(handle, source, source_row, source.x[source_row], source.y[source_row])
+
+    def spawn_row(self, handle: Optional[Entity], source: EntityStore, source_row: int, x: int, y: int) -> int:
+        """Copy a row from `source` into a new row owned by `handle`, placed at (x, y)."""
+        row = self._allocate()
+        self.x[row] = x
+        self.y[row] = y
+        self.ch[row] = source.ch[source_row]
+        self.fg[row] = source.fg[source_row]
+        self.blocks_movement[row] = source.blocks_movement[source_row]
+        self.speed[row] = source.speed[source_row]
+        self.render_order[row] = source.render_order[source_row]
+        self.next_at[row] = -1
+        self.alive[row] = True
+        self.names[row] = source.names[source_row]
+        self.handles[row] = handle
+        return row
+
+    def free(self, row: int) -> None:
+        self.alive[row] = False
+        self.names[row] = None
+        self.handles[row] = None
+        self.free_rows.append(row)
+
+    def live_rows(self) -> np.ndarray:
+        """Return the indices of all rows that belong to an entity."""
+        return np.flatnonzero(self.alive[:self.size])
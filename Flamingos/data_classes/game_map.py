@@ -1,8 +1,12 @@
 from __future__ import annotations
-from typing import Iterable, Optional, TYPE_CHECKING
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
 import numpy as np
 from tcod.console import Console
+from data_classes.distance_map import DistanceMap
 from data_classes.entity import Entity
+from data_classes.entity_store import EntityStore
+from data_classes.lighting import Lighting
+from data_classes.minimap import Minimap
 from data_classes import tile_types
 
 if TYPE_CHECKING:
@@ -13,50 +17,371 @@ class GameMap:
     def __init__(self, width: int, height: int, entities: Iterable[Entity] = ()):
         self.width = width
         self.height = height
-        self.tiles = np.full((width, height), fill_value=tile_types.wall, order="F")
-        self.entities = set(entities)
-        self.visible = np.full((width, height), fill_value=False, order="F")  # Tiles the player can currently see
-        self.explored = np.full((width, height), fill_value=False, order="F")  # Tiles the player has seen before
+        self.tiles = self.new_layer("tiles", tile_types.wall)  # Tile ids into tile_types.tile_palette
+        self.entity_store = EntityStore(game_map=self)
+        # Occupancy index: the first entity row on every tile, -1 for none. The others follow through `next_at`.
+        self.occupants = self.new_layer("occupants", np.int32(-1))
+        self.visible = self.new_layer("visible", False)  # Tiles the player can currently see
+        self.explored = self.new_layer("explored", False)  # Tiles the player has seen before
         self.camera_top_x = 0
         self.camera_bottom_x = 0
         self.camera_top_y = 0
         self.camera_bottom_y = 0
         self.total_discoverable_tiles = 0
-        self.is_floor = np.full((width, height), fill_value=False, order="F")
+        self.discovered_tiles = 0  # Explored floor tiles, kept up to date by reveal()
+        self._percent_discovered = 0
+        self._percent_discovered_key = (0, 0)
+        self.is_floor = self.new_layer("is_floor", False)
+        self.revision = 0  # Bumped whenever tiles change, for caches derived from them
+        self._tile_properties: Dict[str, Tuple[int, np.ndarray]] = {}  # name -> (revision, values)
+        self.distance_map = DistanceMap(self)  # Shared by every monster hunting the player
+        self.minimap = Minimap(self)  # Kept up to date by reveal() and mark_tiles_changed()
+        self.lighting = Lighting(self)  # Torches and glowing monsters, nothing is lit unless lights are added
+        self.visible_window: Tuple[slice, slice] = (slice(0, 0), slice(0, 0))  # Nothing outside is visible
+        self._viewport: Optional[np.ndarray] = None  # Composed tile graphics of the last rendered camera
+        self._viewport_origin = (0, 0)
+        self._dirty_region: Optional[Tuple[int, int, int, int]] = None  # (x1, y1, x2, y2) to recompose
+        for entity in entities:
+            self.add_entity(entity)
+
+    def new_layer(self, name: str, fill_value: np.ndarray) -> np.ndarray:
+        """Allocate the per-tile layer `name` of the map (tiles, visible, ...), filled with `fill_value`."""
+        return np.full((self.width, self.height), fill_value=fill_value, order="F")
+
+    def share_static_layers(self, other: GameMap) -> None:
+        """Use the tiles of `other`, which must be the same level, instead of a copy of them.
+
+        The shared layers are made read-only, `set_tiles` gives a map its own copy before changing them.
+        """
+        other.tiles.setflags(write=False)
+        other.is_floor.setflags(write=False)
+        self.tiles = other.tiles
+        self.is_floor = other.is_floor
+        self.revision = other.revision
+        self._tile_properties = other._tile_properties  # Derived from the tiles only, so just as shareable.
+
+    def own_tiles(self) -> None:
+        """Give this map its own copy of tiles shared with `share_static_layers`, before changing them."""
+        if not isinstance(self.tiles, np.ndarray) or self.tiles.flags.writeable:
+            return  # Chunked maps never share their tiles.
+        self.tiles = self.tiles.copy(order="F")
+        self.is_floor = self.is_floor.copy(order="F")
+        self._tile_properties = {}
+
+    @property
+    def entities(self) -> List[Entity]:
+        """Every entity on the map, in store order. Creates the handles that don't exist yet."""
+        store = self.entity_store
+        return [Entity.for_row(store, row) for row in store.live_rows().tolist()]
+
+    def add_entity(self, entity: Entity) -> None:
+        entity.move_to_store(self.entity_store)
+        self._index_row(entity.index, entity.x, entity.y)
+
+    def remove_entity(self, entity: Entity) -> None:
+        self._unindex_row(entity.index)
+        entity.move_to_store(EntityStore(capacity=1))
+
+    def spawn(self, template: Entity, x: int, y: int) -> int:
+        """Put a copy of `template` at (x, y) and return its row, without creating a handle for it."""
+        return self.spawn_row(template.store, template.index, x, y)
+
+    def spawn_row(self, source: EntityStore, source_row: int, x: int, y: int) -> int:
+        """Copy a row of `source` onto the map at (x, y) and return the new row."""
+        row = self.entity_store.spawn_row(None, source, source_row, x, y)
+        self._index_row(row, x, y)
+        return row
+
+    def move_entity(self, entity: Entity, x: int, y: int) -> None:
+        """Move an entity already on this map to (x, y), keeping the occupancy index in sync."""
+        self._unindex_row(entity.index)
+        self.entity_store.x[entity.index] = x
+        self.entity_store.y[entity.index] = y
+        self._index_row(entity.index, x, y)
+
+    def move_entities(self, entities: Sequence[Entity], xs: np.ndarray, ys: np.ndarray) -> None:
+        """`move_entity` for many entities at once, their positions are written as whole columns."""
+        rows = [entity.index for entity in entities]
+        for row in rows:
+            self._unindex_row(row)
+        self.entity_store.x[rows] = xs
+        self.entity_store.y[rows] = ys
+        for row, x, y in zip(rows, xs.tolist(), ys.tolist()):
+            self._index_row(row, x, y)
+
+    def _index_row(self, row: int, x: int, y: int) -> None:
+        """Add a row to the end of the occupants of (x, y)."""
+        next_at = self.entity_store.next_at
+        next_at[row] = -1
+        last = int(self.occupants[x, y])
+        if last < 0:
+            self.occupants[x, y] = row
+            return
+        while next_at[last] >= 0:
+            last = int(next_at[last])
+        next_at[last] = row
+
+    def index_rows(self, rows: np.ndarray) -> None:
+        """`_index_row` for many new rows of a dense map at once, like the ones from `EntityStore.insert_many`.
+
+        Rows sharing a tile are chained in the order given, after any entities already there.
+        """
+        if not len(rows):
+            return
+        store = self.entity_store
+        xs, ys = store.x[rows], store.y[rows]
+        order = np.argsort(xs.astype(np.int64) * self.height + ys, kind="stable")
+        rows, xs, ys = rows[order], xs[order], ys[order]
+        same_tile = (xs[1:] == xs[:-1]) & (ys[1:] == ys[:-1])
+        store.next_at[rows] = -1
+        store.next_at[rows[:-1][same_tile]] = rows[1:][same_tile]
+
+        firsts = np.concatenate(([True], ~same_tile))
+        rows, xs, ys = rows[firsts], xs[firsts], ys[firsts]
+        occupied = self.occupants[xs, ys] >= 0
+        self.occupants[xs[~occupied], ys[~occupied]] = rows[~occupied]
+        for row, x, y in zip(rows[occupied].tolist(), xs[occupied].tolist(), ys[occupied].tolist()):
+            last = int(self.occupants[x, y])
+            while store.next_at[last] >= 0:
+                last = int(store.next_at[last])
+            store.next_at[last] = row
+
+    def _unindex_row(self, row: int) -> None:
+        store = self.entity_store
+        x, y = int(store.x[row]), int(store.y[row])
+        next_at = store.next_at
+        previous = int(self.occupants[x, y])
+        if previous == row:
+            self.occupants[x, y] = next_at[row]
+            return
+        while previous >= 0 and next_at[previous] != row:
+            previous = int(next_at[previous])
+        if previous < 0:
+            raise ValueError(f"Entity row {row} isn't in the occupancy index at ({x}, {y}), it was moved behind the map's back.")
+        next_at[previous] = next_at[row]
+
+    def rows_at(self, x: int, y: int) -> Iterator[int]:
+        """Yield the entity rows on (x, y), in the order they got there."""
+        if not self.in_bounds(x, y):
+            return
+        row = int(self.occupants[x, y])
+        next_at = self.entity_store.next_at
+        while row >= 0:
+            yield row
+            row = int(next_at[row])
+
+    def get_entities_at_location(self, location_x: int, location_y: int) -> List[Entity]:
+        return [Entity.for_row(self.entity_store, row) for row in self.rows_at(location_x, location_y)]
 
     def get_blocking_entity_at_location(self, location_x: int, location_y: int) -> Optional[Entity]:
-        for entity in self.entities:
-            if entity.blocks_movement and entity.x == location_x and entity.y == location_y:
-                return entity
+        blocks_movement = self.entity_store.blocks_movement
+        for row in self.rows_at(location_x, location_y):
+            if blocks_movement[row]:
+                return Entity.for_row(self.entity_store, row)
 
         return None
 
+    @property
+    def walkable(self) -> np.ndarray:
+        return self.tile_property("walkable")
+
+    @property
+    def transparent(self) -> np.ndarray:
+        return self.tile_property("transparent")
+
+    def tile_property(self, name: str) -> np.ndarray:
+        """Return the palette field `name` for every tile, cached until the tiles change."""
+        cached = self._tile_properties.get(name)
+        if cached is None or cached[0] != self.revision:
+            cached = (self.revision, np.take(tile_types.tile_palette[name], self.tiles))
+            self._tile_properties[name] = cached
+        return cached[1]
+
     def in_bounds(self, x: int, y: int) -> bool:
         return 0 <= x < self.width and 0 <= y < self.height
 
+    def window_around(self, x: int, y: int, radius: int) -> Tuple[slice, slice]:
+        """Return the square of `radius` tiles around (x, y), clipped to the map, as a 2D array index."""
+        return (
+            slice(max(x - radius, 0), min(x + radius + 1, self.width)),
+            slice(max(y - radius, 0), min(y + radius + 1, self.height)),
+        )
+
+    def reveal(self, window: Tuple[slice, slice]) -> None:
+        """Add the visible tiles inside `window` to the explored ones, counting newly discovered floor."""
+        visible = self.visible[window]
+        explored = self.explored[window]
+        self.discovered_tiles += np.count_nonzero(visible & ~explored & self.is_floor[window])
+        self.explored[window] = explored | visible
+        self.minimap.update(window)
+
+    def set_tiles(self, window: Tuple[slice, slice], tile_ids: np.ndarray) -> None:
+        """Change the tiles inside `window` at runtime, copying tiles shared with other maps first."""
+        self.own_tiles()
+        self.tiles[window] = tile_ids
+        self.mark_tiles_changed(window)
+
+    def mark_tiles_changed(self, window: Optional[Tuple[slice, slice]] = None) -> None:
+        """Call after editing `tiles` at runtime. Invalidates caches derived from the tile data.
+
+        Shared tiles are read-only, edit them through `set_tiles`. A map that had its tiles
+        changed stops sharing them either way, along with the tile property cache.
+        """
+        self.own_tiles()
+        self.revision += 1
+        self.mark_dirty(window)
+        self.minimap.update(window)
+
+    def mark_dirty(self, window: Optional[Tuple[slice, slice]] = None) -> None:
+        """Flag tiles whose visibility or explored state changed, so render recomposes them.
+
+        With no `window` the whole cached viewport is thrown away.
+        """
+        if window is None:
+            self._viewport = None
+            return
+        x_slice, y_slice = window
+        region = (x_slice.start, y_slice.start, x_slice.stop, y_slice.stop)
+        if self._dirty_region is not None:
+            region = (
+                min(region[0], self._dirty_region[0]),
+                min(region[1], self._dirty_region[1]),
+                max(region[2], self._dirty_region[2]),
+                max(region[3], self._dirty_region[3]),
+            )
+        self._dirty_region = region
+
+    @property
+    def percent_discovered(self) -> int:
+        """Percentage of the floor the player has explored, only recomputed when the count changes."""
+        key = (self.discovered_tiles, self.total_discoverable_tiles)
+        if key != self._percent_discovered_key:
+            self._percent_discovered_key = key
+            self._percent_discovered = int((self.discovered_tiles / self.total_discoverable_tiles) * 100)
+        return self._percent_discovered
+
     def render(self, console: Console, player: Entity) -> None:
 
         self.update_camera_points(console, player)
+        self._update_viewport()
 
-        dummy_visible = self.visible[self.camera_top_x: self.camera_bottom_x, self.camera_top_y: self.camera_bottom_y]
-        dummy_explored = self.explored[self.camera_top_x: self.camera_bottom_x, self.camera_top_y: self.camera_bottom_y]
-        dummy_tiles = self.tiles[self.camera_top_x: self.camera_bottom_x, self.camera_top_y: self.camera_bottom_y]
+        width, height = self._viewport.shape
+        if (width, height) != (console.width, console.height):
+            console.clear()
+        console.rgb[0:width, 0:height] = self._viewport
+        if self.lighting.active:
+            # The cached viewport stays unlit, lights can change every frame.
+            self.lighting.shade(
+                console.rgb[0:width, 0:height],
+                self.camera_top_x,
+                self.camera_top_y,
+                self.camera_bottom_x,
+                self.camera_bottom_y,
+            )
+        self._draw_entities(console, player)
 
-        console.tiles_rgb[0:self.width, 0:self.height] = np.select(
-            condlist=[dummy_visible, dummy_explored],
-            choicelist=[dummy_tiles["light"], dummy_tiles["dark"]],
-            default=tile_types.SHROUD
-        )
-        for entity in self.entities:
-            # Only print entities that are in the FOV
-            if self.visible[entity.x, entity.y]:
-                console.print(entity.x - self.camera_top_x, entity.y - self.camera_top_y, entity.char, fg=entity.color)
+        self.minimap.draw(console, player)
+        console.print(0, 0, str(self.percent_discovered) + " % discovered", fg=(255, 255, 255))
+
+    def _draw_entities(self, console: Console, player: Entity) -> None:
+        """Draw the entities in view of the camera straight into `console`, in one scatter.
 
-        #tmp2 = np.count_nonzero(np.logical_and(np.logical_or(self.visible, self.explored), self.is_floor))
-        tmp2 = np.count_nonzero(np.logical_and(self.explored, self.is_floor))
-        print(tmp2)
+        Entities are found through the occupancy index of the camera rectangle, so drawing costs
+        the size of the screen and the entities on it, not everyone on the map. Entities sharing
+        a tile are drawn by `render_order`, the highest layer ends up on top, ties go to the one
+        that got there last. The player is always drawn.
+        """
+        x1, y1 = self.camera_top_x, self.camera_top_y
+        x2, y2 = self.camera_bottom_x, self.camera_bottom_y
+        # Chunked maps only index by slices, read both layers for the camera window.
+        occupants = self.occupants[x1:x2, y1:y2]
+        shown = (occupants >= 0) & self.visible[x1:x2, y1:y2]
+        if player.gamemap is self and x1 <= player.x < x2 and y1 <= player.y < y2:
+            shown[player.x - x1, player.y - y1] = True
+        xs, ys = np.nonzero(shown)
+        if not len(xs):
+            return
 
-        console.print(0, 0, str(int((tmp2 / self.total_discoverable_tiles)*100)) + " % discovered", fg=(255, 255, 255))
+        store = self.entity_store
+        top = occupants[xs, ys]
+        top_order = store.render_order[top]
+        # Walk the chains of tiles with more than one entity, one link at a time.
+        tiles = np.arange(len(top))
+        rows = store.next_at[top]
+        while True:
+            more = rows >= 0
+            tiles, rows = tiles[more], rows[more]
+            if not len(rows):
+                break
+            order = store.render_order[rows]
+            higher = order >= top_order[tiles]
+            top[tiles[higher]] = rows[higher]
+            top_order[tiles[higher]] = order[higher]
+            rows = store.next_at[rows]
+
+        console.rgb["ch"][xs, ys] = store.ch[top]
+        console.rgb["fg"][xs, ys] = store.fg[top]
+
+    def _compose(self, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """Return the graphics for the map rectangle from (x1, y1) up to (x2, y2)."""
+        dummy_visible = self.visible[x1:x2, y1:y2]
+        dummy_explored = self.explored[x1:x2, y1:y2]
+        dummy_tiles = self.tiles[x1:x2, y1:y2]
+
+        # 2 for tiles in FOV, 1 for explored ones and 0 for the rest, picks the row of tile_graphics.
+        visibility = np.where(dummy_visible, 2, dummy_explored)
+        return tile_types.tile_graphics[visibility, dummy_tiles]
+
+    def _update_viewport(self) -> None:
+        """Bring the cached viewport in line with the camera, only recomposing tiles that changed.
+
+        When the camera scrolls the still visible part of the old viewport is shifted over
+        and only the newly exposed strips are composed.
+        """
+        x1, y1 = self.camera_top_x, self.camera_top_y
+        x2, y2 = self.camera_bottom_x, self.camera_bottom_y
+        old = self._viewport
+        if old is None or old.shape != (x2 - x1, y2 - y1):
+            self._viewport = self._compose(x1, y1, x2, y2)
+            self._viewport_origin = (x1, y1)
+            self._dirty_region = None
+            return
+
+        old_x, old_y = self._viewport_origin
+        if (old_x, old_y) != (x1, y1):
+            self._viewport = np.empty_like(old)
+            keep_x1, keep_x2 = max(x1, old_x), min(x2, old_x + old.shape[0])
+            keep_y1, keep_y2 = max(y1, old_y), min(y2, old_y + old.shape[1])
+            if keep_x1 < keep_x2 and keep_y1 < keep_y2:
+                self._viewport[keep_x1 - x1:keep_x2 - x1, keep_y1 - y1:keep_y2 - y1] = (
+                    old[keep_x1 - old_x:keep_x2 - old_x, keep_y1 - old_y:keep_y2 - old_y]
+                )
+            else:
+                keep_x1 = keep_x2 = x1
+                keep_y1 = keep_y2 = y1
+            self._viewport_origin = (x1, y1)
+            # Compose the strips the old viewport didn't cover.
+            for region in (
+                    (x1, y1, keep_x1, y2),
+                    (keep_x2, y1, x2, y2),
+                    (keep_x1, y1, keep_x2, keep_y1),
+                    (keep_x1, keep_y2, keep_x2, y2),
+            ):
+                self._recompose(*region)
+
+        if self._dirty_region is not None:
+            self._recompose(*self._dirty_region)
+            self._dirty_region = None
+
+    def _recompose(self, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Recompose the part of the cached viewport that overlaps the given map rectangle."""
+        x1, y1 = max(x1, self.camera_top_x), max(y1, self.camera_top_y)
+        x2, y2 = min(x2, self.camera_bottom_x), min(y2, self.camera_bottom_y)
+        if x1 >= x2 or y1 >= y2:
+            return
+        self._viewport[x1 - self.camera_top_x:x2 - self.camera_top_x, y1 - self.camera_top_y:y2 - self.camera_top_y] = (
+            self._compose(x1, y1, x2, y2)
+        )
 
     def update_camera_points(self, console: Console, player: Entity) -> None:
         self.camera_top_x = (player.x - int(console.width / 2))
@@ -77,4 +402,10 @@ class GameMap:
             self.camera_bottom_y = self.height
             self.camera_top_y = self.height - console.height
 
+        # Maps smaller than the console are drawn from its top left corner.
+        self.camera_top_x = max(self.camera_top_x, 0)
+        self.camera_top_y = max(self.camera_top_y, 0)
+        self.camera_bottom_x = min(self.camera_bottom_x, self.width)
+        self.camera_bottom_y = min(self.camera_bottom_y, self.height)
+
         # print(self.camera_top_x, " ", self.camera_bottom_x, " ", self.camera_top_y, " ", self.camera_bottom_y)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import io
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from data_classes.entity import Entity
+from data_classes.game_map import GameMap
+from data_classes.lighting import LightSource
+from data_classes.save_format import pack_game_map, unpack_game_map
+
+Position = Tuple[int, int]
+# A light of a compressed level: the light, whether it is static, and which of the level's
+# packed entities it follows, if any.
+StoredLight = Tuple[LightSource, bool, Optional[int]]
+
+
+class LevelStore:
+    """Levels the player has left, by depth, with where to put the player on coming back.
+
+    The `hot_levels` most recently left levels stay in memory as they are. Older ones are
+    compressed into `save_format` archives in memory: tile ids, bit-packed masks and an entity
+    table, a few kilobytes a level. They are unpacked again when the player returns. Their
+    light sources are kept as they are, and follow the same entities again once unpacked.
+    """
+
+    def __init__(self, hot_levels: int = 3):
+        self.hot_levels = hot_levels
+        self.hot: OrderedDict[int, Tuple[GameMap, Position]] = OrderedDict()
+        self.cold: Dict[int, Tuple[bytes, Position, List[StoredLight]]] = {}
+
+    def __contains__(self, depth: int) -> bool:
+        return depth in self.hot or depth in self.cold
+
+    def store(self, depth: int, game_map: GameMap, position: Position) -> None:
+        """Keep a level the player just left, compressing the coldest levels if there are too many."""
+        self.cold.pop(depth, None)
+        self.hot[depth] = (game_map, position)
+        self.hot.move_to_end(depth)
+        while len(self.hot) > self.hot_levels:
+            cold_depth, (cold_map, cold_position) = self.hot.popitem(last=False)
+            self.cold[cold_depth] = (self.compress(cold_map), cold_position, self.detach_lights(cold_map))
+
+    def take(self, depth: int) -> Optional[Tuple[GameMap, Position]]:
+        """Remove level `depth` from the store and return it, or None if it was never stored."""
+        if depth in self.hot:
+            return self.hot.pop(depth)
+        if depth in self.cold:
+            data, position, lights = self.cold.pop(depth)
+            game_map = self.decompress(data)
+            self.attach_lights(game_map, lights)
+            return game_map, position
+        return None
+
+    @staticmethod
+    def compress(game_map: GameMap) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **pack_game_map(game_map))
+        return buffer.getvalue()
+
+    @staticmethod
+    def decompress(data: bytes) -> GameMap:
+        with np.load(io.BytesIO(data)) as arrays:
+            game_map, _ = unpack_game_map(arrays)
+        return game_map
+
+    @staticmethod
+    def detach_lights(game_map: GameMap) -> List[StoredLight]:
+        """Return the lights of `game_map`, with the entities they follow as positions in its packed entity table."""
+        rows = game_map.entity_store.live_rows()  # The order `pack_game_map` writes the entities in.
+        lighting = game_map.lighting
+        stored: List[StoredLight] = []
+        for static, lights in ((True, lighting.static_lights), (False, lighting.dynamic_lights)):
+            for light in lights:
+                entity = None
+                if light.entity is not None and light.entity.gamemap is game_map:
+                    entity = int(np.searchsorted(rows, light.entity.index))
+                    # The handle would keep its store, and through it the uncompressed map, alive.
+                    light.entity = None
+                stored.append((light, static, entity))
+        return stored
+
+    @staticmethod
+    def attach_lights(game_map: GameMap, lights: List[StoredLight]) -> None:
+        """Give an unpacked level back the lights `detach_lights` took from it."""
+        rows = game_map.entity_store.live_rows()
+        for light, static, entity in lights:
+            if entity is not None:
+                light.entity = Entity.for_row(game_map.entity_store, int(rows[entity]))
+            if static:
+                game_map.lighting.add_static_light(light)
+            else:
+                game_map.lighting.add_dynamic_light(light)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import functools
+from collections import OrderedDict
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+import tcod.constants
+from tcod.map import compute_fov
+
+if TYPE_CHECKING:
+    from data_classes.entity import Entity
+    from data_classes.game_map import GameMap
+
+
+class LightSource:
+    """A light with a colour that fades out linearly over `radius` tiles and is blocked by walls.
+
+    A light with an `entity` follows it around, like a glowing monster.
+    """
+
+    def __init__(
+            self,
+            x: int = 0,
+            y: int = 0,
+            radius: int = 6,
+            color: Tuple[int, int, int] = (255, 160, 60),
+            intensity: float = 0.6,
+            entity: Optional[Entity] = None,
+    ):
+        self._x = x
+        self._y = y
+        self.radius = radius
+        self.color = color
+        self.intensity = intensity
+        self.entity = entity
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        if self.entity is not None:
+            return self.entity.x, self.entity.y
+        return self._x, self._y
+
+    @property
+    def rgb(self) -> np.ndarray:
+        return np.asarray(self.color, dtype=np.float32) * (self.intensity / 255)
+
+
+@functools.lru_cache(maxsize=None)
+def _falloff(radius: int) -> np.ndarray:
+    """Brightness by offset from the light, 1 at its center down to 0 just past `radius`."""
+    offsets = np.arange(-radius, radius + 1)
+    distance = np.sqrt(offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2)
+    return np.clip(1 - distance / (radius + 1), 0, 1).astype(np.float32)
+
+
+class Lighting:
+    """The light sources of a map and the light they shed, as an RGB multiplier per tile.
+
+    Static lights are baked once into a light map for the whole level, and again only when
+    the tiles change. Dynamic lights are computed every frame, but only inside their radius
+    and only where they reach the viewport. Chunked maps are too big to bake, their static
+    lights are handled like dynamic ones.
+    """
+
+    def __init__(self, game_map: GameMap, cache_size: int = 1024):
+        self.game_map = game_map
+        self.static_lights: List[LightSource] = []
+        self.dynamic_lights: List[LightSource] = []
+        self.cache_size = cache_size
+        self.static_version = 0  # Bumped whenever the static lights change, the baked light map depends on them.
+        self._baked: Optional[np.ndarray] = None
+        self._baked_key: Optional[Tuple[int, int]] = None  # (map revision, static_version)
+        # Light of recently seen dynamic lights: (x, y, radius, revision) -> (window, brightness).
+        self._shed_cache: OrderedDict[Tuple[int, int, int, int], Tuple[Tuple[slice, slice], np.ndarray]] = OrderedDict()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.static_lights or self.dynamic_lights)
+
+    def add_static_light(self, light: LightSource) -> None:
+        self.static_lights.append(light)
+        self.static_version += 1
+
+    def remove_static_light(self, light: LightSource) -> None:
+        self.static_lights.remove(light)
+        self.static_version += 1
+
+    def static_lights_changed(self) -> None:
+        """Call after moving, recolouring or resizing a static light, so it is baked again."""
+        self.static_version += 1
+
+    def add_dynamic_light(self, light: LightSource) -> None:
+        self.dynamic_lights.append(light)
+
+    def shed(self, light: LightSource) -> Tuple[Tuple[slice, slice], np.ndarray]:
+        """Return the window a light reaches and its brightness there, 0 behind walls."""
+        x, y = light.position
+        key = (x, y, light.radius, self.game_map.revision)
+        cached = self._shed_cache.get(key)
+        if cached is not None:
+            self._shed_cache.move_to_end(key)
+            return cached
+
+        window = self.game_map.window_around(x, y, light.radius)
+        x_slice, y_slice = window
+        reached = compute_fov(
+            self.game_map.transparent[window],
+            (x - x_slice.start, y - y_slice.start),
+            radius=light.radius,
+            algorithm=tcod.constants.FOV_SYMMETRIC_SHADOWCAST,
+        )
+        # The falloff kernel is centered on the light, clip it the same way the map clipped the window.
+        left, top = x - light.radius, y - light.radius
+        kernel = _falloff(light.radius)[
+            x_slice.start - left:x_slice.stop - left,
+            y_slice.start - top:y_slice.stop - top,
+        ]
+        cached = (window, kernel * reached)
+        self._shed_cache[key] = cached
+        if len(self._shed_cache) > self.cache_size:
+            self._shed_cache.popitem(last=False)
+        return cached
+
+    def _add_light(self, light_map: np.ndarray, light: LightSource, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Add the light of `light` to `light_map`, which covers the map from (x1, y1) up to (x2, y2)."""
+        x, y = light.position
+        radius = light.radius
+        if x + radius < x1 or x - radius >= x2 or y + radius < y1 or y - radius >= y2:
+            return  # Doesn't reach the area at all.
+        (x_slice, y_slice), brightness = self.shed(light)
+        cx1, cx2 = max(x_slice.start, x1), min(x_slice.stop, x2)
+        cy1, cy2 = max(y_slice.start, y1), min(y_slice.stop, y2)
+        if cx1 >= cx2 or cy1 >= cy2:
+            return
+        clipped = brightness[cx1 - x_slice.start:cx2 - x_slice.start, cy1 - y_slice.start:cy2 - y_slice.start]
+        light_map[cx1 - x1:cx2 - x1, cy1 - y1:cy2 - y1] += clipped[..., np.newaxis] * light.rgb
+
+    def baked(self) -> Optional[np.ndarray]:
+        """Return the light of every static light over the whole map, baking it if the map or the lights changed.
+
+        Returns None when there is nothing to bake: no static lights, or a chunked map.
+        """
+        if not self.static_lights or not isinstance(self.game_map.tiles, np.ndarray):
+            self._baked = self._baked_key = None
+            return None
+        key = (self.game_map.revision, self.static_version)
+        if key != self._baked_key:
+            self._baked_key = key
+            self._baked = np.zeros((self.game_map.width, self.game_map.height, 3), dtype=np.float32)
+            for light in self.static_lights:
+                self._add_light(self._baked, light, 0, 0, self.game_map.width, self.game_map.height)
+        return self._baked
+
+    def light_map(self, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """Return the light of every light source over the map from (x1, y1) up to (x2, y2)."""
+        baked = self.baked()
+        if baked is not None:
+            light_map = baked[x1:x2, y1:y2].copy()
+            dynamic = self.dynamic_lights
+        else:
+            light_map = np.zeros((x2 - x1, y2 - y1, 3), dtype=np.float32)
+            dynamic = self.static_lights + self.dynamic_lights
+        for light in dynamic:
+            if light.entity is not None and light.entity.gamemap is not self.game_map:
+                continue  # Its entity left the map.
+            self._add_light(light_map, light, x1, y1, x2, y2)
+        return light_map
+
+    def shade(self, graphics: np.ndarray, x1: int, y1: int, x2: int, y2: int) -> None:
+        """Brighten the colours of the visible tiles in `graphics`, the map from (x1, y1) up to (x2, y2)."""
+        light_map = self.light_map(x1, y1, x2, y2)
+        lit = self.game_map.visible[x1:x2, y1:y2] & light_map.any(axis=-1)
+        if not lit.any():
+            return
+        scale = 1 + light_map[lit]
+        for field in ("fg", "bg"):
+            graphics[field][lit] = np.minimum(graphics[field][lit] * scale, 255).astype(np.uint8)
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from tcod.console import Console
+
+from data_classes import tile_types
+
+if TYPE_CHECKING:
+    from data_classes.entity import Entity
+    from data_classes.game_map import GameMap
+
+# Block states, indexing `BLOCK_GRAPHICS`.
+UNEXPLORED = 0
+EXPLORED = 1  # Seen, but no floor in it.
+EXPLORED_FLOOR = 2
+
+BLOCK_GRAPHICS = np.array(
+    [
+        (ord(" "), (255, 255, 255), (15, 15, 25)),
+        (ord(" "), (255, 255, 255), (60, 60, 90)),
+        (ord(" "), (255, 255, 255), (170, 150, 110)),
+    ],
+    dtype=tile_types.graphic_dt,
+)
+
+
+class Minimap:
+    """An overview of the explored part of a map, one cell per `block` x `block` tiles.
+
+    Kept up to date a window at a time as tiles get explored, so an update costs the size of
+    the window and drawing it costs the size of the minimap, never the size of the map.
+    """
+
+    def __init__(self, game_map: GameMap, block: int = 8, max_size: Tuple[int, int] = (30, 20)):
+        self.game_map = game_map
+        self.block = block
+        self.max_size = max_size  # Largest area drawn, in cells, it scrolls with the player on bigger maps.
+        self.blocks = np.full((-(-game_map.width // block), -(-game_map.height // block)), UNEXPLORED, dtype=np.uint8)
+
+    def update(self, window: Optional[Tuple[slice, slice]] = None) -> None:
+        """Recompute the blocks overlapping `window`, or every block if it is None."""
+        if window is None:
+            x1, y1, x2, y2 = 0, 0, self.game_map.width, self.game_map.height
+        else:
+            x_slice, y_slice = window
+            x1, y1, x2, y2 = x_slice.start, y_slice.start, x_slice.stop, y_slice.stop
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        block = self.block
+        bx1, by1 = x1 // block, y1 // block
+        bx2, by2 = -(-x2 // block), -(-y2 // block)
+        tiles = (slice(bx1 * block, min(bx2 * block, self.game_map.width)), slice(by1 * block, min(by2 * block, self.game_map.height)))
+        explored = self.game_map.explored[tiles]
+        floor = explored & self.game_map.is_floor[tiles]
+
+        def reduce(mask: np.ndarray) -> np.ndarray:
+            # Blocks at the right and bottom edges may be cut off by the map, pad them out.
+            padded = np.zeros(((bx2 - bx1) * block, (by2 - by1) * block), dtype=bool)
+            padded[:mask.shape[0], :mask.shape[1]] = mask
+            return padded.reshape(bx2 - bx1, block, by2 - by1, block).any(axis=(1, 3))
+
+        self.blocks[bx1:bx2, by1:by2] = np.where(reduce(floor), EXPLORED_FLOOR, reduce(explored).astype(np.uint8))
+
+    def draw(self, console: Console, player: Entity) -> None:
+        """Blit the minimap into the top right corner of `console`, centered on the player if it doesn't fit."""
+        blocks_wide, blocks_tall = self.blocks.shape
+        width = min(blocks_wide, self.max_size[0], console.width)
+        height = min(blocks_tall, self.max_size[1], console.height)
+        player_x, player_y = player.x // self.block, player.y // self.block
+        left = min(max(player_x - width // 2, 0), blocks_wide - width)
+        top = min(max(player_y - height // 2, 0), blocks_tall - height)
+
+        x = console.width - width
+        console.rgb[x:, 0:height] = BLOCK_GRAPHICS[self.blocks[left:left + width, top:top + height]]
+        console.print(x + player_x - left, player_y - top, player.char, fg=player.color)
@@ -0,0 +1,9 @@
+from enum import IntEnum
+
+
+class RenderOrder(IntEnum):
+    """Drawing layers for entities, higher layers are drawn over lower ones on the same tile."""
+    CORPSE = 0
+    ITEM = 1
+    ACTOR = 2
+    PLAYER = 3
@@ -0,0 +1,112 @@
+"""Compact on-disk format for a GameMap and its entities.
+
+A level is written as an uncompressed .npz archive of flat arrays:
+tiles as their `tile_types` ids, `explored` and `is_floor` as bit-packed masks, and the entities as one
+column per EntityStore field. Loading is a handful of `np.load` reads, array gathers and
+column assignments, with no Python work per tile or per entity: entity handles are only
+created when something asks for them.
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from data_classes.entity import Entity
+from data_classes.game_map import GameMap
+from data_classes.render_order import RenderOrder
+
+FORMAT_VERSION = 2
+
+
+def _pack_mask(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(mask.ravel(order="F"))
+
+
+def _unpack_mask(packed: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    count = shape[0] * shape[1]
+    return np.unpackbits(packed, count=count).astype(bool).reshape(shape, order="F")
+
+
+def pack_game_map(game_map: GameMap, player: Optional[Entity] = None) -> Dict[str, np.ndarray]:
+    """Return the arrays describing `game_map`, marking `player` among its entities if given."""
+    if not isinstance(game_map.tiles, np.ndarray):
+        raise TypeError("Only dense maps can be packed, chunked maps keep their own spill files.")
+
+    store = game_map.entity_store
+    rows = store.live_rows()
+    player_position = np.flatnonzero(rows == player.index) if player is not None and player.store is store else []
+
+    return {
+        "version": np.array(FORMAT_VERSION),
+        "shape": np.array([game_map.width, game_map.height]),
+        "counts": np.array([game_map.discovered_tiles, game_map.total_discoverable_tiles]),
+        "tile_ids": game_map.tiles,
+        "explored": _pack_mask(game_map.explored),
+        "is_floor": _pack_mask(game_map.is_floor),
+        "entity_x": store.x[rows],
+        "entity_y": store.y[rows],
+        "entity_ch": store.ch[rows],
+        "entity_fg": store.fg[rows],
+        "entity_blocks_movement": store.blocks_movement[rows],
+        "entity_speed": store.speed[rows],
+        "entity_render_order": store.render_order[rows],
+        "entity_name": np.array([store.names[row] for row in rows], dtype=str),
+        "player": np.array(player_position[0] if len(player_position) else -1),
+    }
+
+
+def unpack_game_map(arrays: Dict[str, np.ndarray], shared: Optional[GameMap] = None) -> Tuple[GameMap, Optional[Entity]]:
+    """Rebuild a GameMap from `pack_game_map` output. Returns the map and the player, if one was saved.
+
+    With `shared`, a map of the same level, the tiles aren't decoded at all: the new map shares
+    the static layers of `shared` instead, see `GameMap.share_static_layers`.
+    """
+    if int(arrays["version"]) != FORMAT_VERSION:
+        raise ValueError(f"Unsupported save format version {int(arrays['version'])}.")
+    width, height = (int(n) for n in arrays["shape"])
+    game_map = GameMap(width, height)
+
+    if shared is not None:
+        game_map.share_static_layers(shared)
+    else:
+        game_map.tiles[:] = arrays["tile_ids"]
+        game_map.is_floor[:] = _unpack_mask(arrays["is_floor"], (width, height))
+    game_map.explored[:] = _unpack_mask(arrays["explored"], (width, height))
+    game_map.discovered_tiles, game_map.total_discoverable_tiles = (int(n) for n in arrays["counts"])
+    game_map.minimap.update()
+
+    player_index = int(arrays["player"])
+    count = len(arrays["entity_x"])
+    if "entity_render_order" in arrays:
+        render_order = arrays["entity_render_order"]
+    else:
+        # Saved before entities had draw layers, they were all actors then.
+        render_order = np.full(count, RenderOrder.ACTOR, dtype=np.int8)
+        if player_index >= 0:
+            render_order[player_index] = RenderOrder.PLAYER
+    # Entities of a kind share one name string, like spawned ones do.
+    names, name_ids = np.unique(arrays["entity_name"], return_inverse=True)
+    store = game_map.entity_store
+    rows = store.insert_many(
+        arrays["entity_x"],
+        arrays["entity_y"],
+        arrays["entity_ch"],
+        arrays["entity_fg"],
+        np.array(names.tolist(), dtype=object)[name_ids].tolist(),
+        arrays["entity_blocks_movement"],
+        arrays["entity_speed"],
+        render_order,
+    )
+    game_map.index_rows(rows)
+    player = Entity.for_row(store, int(rows[player_index])) if player_index >= 0 else None
+    return game_map, player
+
+
+def save_game_map(path: str, game_map: GameMap, player: Optional[Entity] = None) -> None:
+    np.savez(path, **pack_game_map(game_map, player))
+
+
+def load_game_map(path: str) -> Tuple[GameMap, Optional[Entity]]:
+    with np.load(path) as arrays:
+        return unpack_game_map(arrays)
@@ -21,6 +21,11 @@ tile_dt = np.dtype(
 )
 
 
+# Every registered tile, indexed by tile id. Maps store tile ids and look properties up here.
+tile_palette = np.zeros(256, dtype=tile_dt)
+tile_count = 0
+
+
 def new_tile(
         *,      # Enforce the use of keywords, so that parameter order doesn't matter.
         walkable: int,
@@ -34,29 +39,46 @@ def new_tile(
 # SHROUD represents unexplored, unseen tiles
 SHROUD = np.array((ord(" "), (255, 255, 255), (0, 0, 0)), dtype=graphic_dt)
 
-floor = new_tile(
+# Graphics of each tile id, by visibility: 0 for unexplored, 1 for explored but not in FOV and 2 for in FOV.
+tile_graphics = np.full((3, 256), fill_value=SHROUD, dtype=graphic_dt)
+
+
+def register_tile(tile: np.ndarray) -> np.uint8:
+    """Add a tile made by `new_tile` to the palette and return its id."""
+    global tile_count
+    if tile_count == len(tile_palette):
+        raise ValueError("The tile palette is full.")
+    tile_id = np.uint8(tile_count)
+    tile_palette[tile_id] = tile
+    tile_graphics[1, tile_id] = tile["dark"]
+    tile_graphics[2, tile_id] = tile["light"]
+    tile_count += 1
+    return tile_id
+
+
+floor = register_tile(new_tile(
     walkable=True,
     transparent=True,
     dark=(ord(" "), (255, 255, 255), (128, 128, 128)),
     light=(ord(" "), (255, 255, 255), (200, 180, 50)),
-)
-wall = new_tile(
+))
+wall = register_tile(new_tile(
     walkable=False,
     transparent=False,
     dark=(ord(" "), (255, 255, 255), (60, 60, 60)),
     light=(ord(" "), (255, 255, 255), (130, 110, 50)),
-)
+))
 
-door = new_tile(
+door = register_tile(new_tile(
     walkable=True,
     transparent=False,
     dark=(ord(" "), (164, 120, 0), (102, 51, 0)),
     light=(ord(" "), (255, 188, 0), (153, 76, 0)),
-)
+))
 
-hallway = new_tile(
+hallway = register_tile(new_tile(
     walkable=True,
     transparent=True,
     dark=(ord(" "), (255, 255, 255), (128, 128, 128)),
     light=(ord(" "), (255, 255, 255), (200, 180, 50)),
-)
\ No newline at end of file
+))
\ No newline at end of file
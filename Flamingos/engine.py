@@ -1,50 +1,201 @@
-from typing import Set, Iterable, Any
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Set, Iterable, Any, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
 
 from tcod.context import Context
 from tcod.console import Console
 from tcod.map import compute_fov
+from actions import Action, MeleeAction
 from data_classes.entity import Entity
 from input_handlers import EventHandler
 from data_classes.game_map import GameMap
+from data_classes.level_store import LevelStore
+from move_resolver import resolve_moves
+from profiler import FrameProfiler
+from turn_scheduler import TurnScheduler
+
+if TYPE_CHECKING:
+    from generators.level_pregenerator import LevelPregenerator
+
+FOV_RADIUS = 10
 
 
 class Engine:
-    def __init__(self, event_handler: EventHandler, game_map: GameMap, player: Entity):
+    def __init__(
+            self,
+            event_handler: EventHandler,
+            game_map: GameMap,
+            player: Entity,
+            fov_cache_size: int = 0,
+            activation_radius: int = 20,
+            levels: Optional[LevelPregenerator] = None,
+            profiler: Optional[FrameProfiler] = None,
+    ):
 
         self.event_handler = event_handler
         self.game_map = game_map
         self.player = player
+        # FOV windows of recently visited positions, keyed by (x, y, map revision). Disabled when the size is 0.
+        self.fov_cache_size = fov_cache_size
+        self.fov_cache: OrderedDict[Tuple[int, int, int], np.ndarray] = OrderedDict()
+        # Monsters further than activation_radius from the player and out of sight stay dormant.
+        self.scheduler = TurnScheduler(activation_radius)
+        # Times every phase of a turn and a frame, does nothing unless enabled.
+        self.profiler = profiler if profiler is not None else FrameProfiler()
+        # Levels below this one, generated in the background. Without it the player can't go down.
+        self.levels = levels
+        self.depth = 1
+        # Levels the player has been on, the most recent ones in memory and the rest compressed.
+        self.visited = LevelStore()
+        if levels is not None:
+            levels.prefetch(self.depth)
+        self.update_fov()
+
+    def change_map(self, game_map: GameMap, x: int, y: int) -> None:
+        """Move the player to (x, y) on another map and make it the current one."""
+        self.player.place(x, y, game_map)
+        self.game_map = game_map
+        self.scheduler.reset()
+        self.fov_cache.clear()  # Keyed by map revision, which starts over on every map.
         self.update_fov()
 
+    def descend(self) -> None:
+        """Go down to the next level, which is usually generated already."""
+        self.go_to_level(self.depth + 1)
+
+    def ascend(self) -> None:
+        """Go back up to the previous level."""
+        if self.depth > 1:
+            self.go_to_level(self.depth - 1)
+
+    def go_to_level(self, depth: int) -> None:
+        """Make level `depth` the current one, back where the player left it if it was visited before."""
+        stored = self.visited.take(depth)
+        if stored is not None:
+            game_map, (x, y) = stored
+        elif self.levels is not None:
+            game_map, (x, y) = self.levels.take(depth)
+        else:
+            return  # Nothing to go to.
+
+        old_map, old_position = self.game_map, (self.player.x, self.player.y)
+        self.change_map(game_map, x, y)
+        self.visited.store(self.depth, old_map, old_position)
+        self.depth = depth
+
     def handle_enemy_turns(self) -> None:
-        for entity in self.game_map.entities - {self.player}:
-            print(f'The {entity.name} wonders when it will get to take a real turn.')
+        """Let every monster whose turn came up act, resolving their moves in batches.
+
+        A batch collects turns until a monster comes up a second time, a fast monster's
+        second step has to see where its first one went.
+        """
+        batch: List[Entity] = []
+        in_batch: Set[Entity] = set()
+        for entity in self.scheduler.advance(self):
+            if entity in in_batch:
+                self.resolve_enemy_batch(batch)
+                batch, in_batch = [], set()
+            batch.append(entity)
+            in_batch.add(entity)
+        self.resolve_enemy_batch(batch)
+
+    def resolve_enemy_batch(self, batch: List[Entity]) -> None:
+        """Step every monster of `batch` towards the player, by the rules of `resolve_moves` whatever the batch size."""
+        if not batch:
+            return
+        # Every monster follows the same distance field towards the player, it is only rebuilt when needed.
+        distance_map = self.game_map.distance_map
+        distance_map.update(self.player.x, self.player.y)
+        store = self.game_map.entity_store
+        rows = np.fromiter((entity.index for entity in batch), dtype=np.intp, count=len(batch))
+        dx, dy, _ = distance_map.next_steps(store.x[rows], store.y[rows])
 
-    def handle_events(self, events: Iterable[Any]) -> None:
+        result = resolve_moves(self.game_map, batch, dx, dy, self.player)
+        for entity in result.attackers:
+            MeleeAction(self.player.x - entity.x, self.player.y - entity.y).perform(self, entity)
+
+    def handle_events(self, events: Iterable[Any]) -> int:
+        """Play the turns of a batch of events, returning how many of them turned into an action.
+
+        The FOV is only computed once, after the last turn of the batch. When key repeat queues
+        up several moves, the ones in between are never drawn anyway.
+        """
+        turns = 0
         for event in events:
-            action = self.event_handler.dispatch(event)
+            with self.profiler.phase("dispatch"):
+                action = self.event_handler.dispatch(event)
 
             if action is None:
                 continue
-            action.perform(self, self.player)
+            self.play_turn(action)
+            turns += 1
+        if turns:
+            with self.profiler.phase("update_fov"):
+                self.update_fov()
+        return turns
+
+    def handle_action(self, action: Action) -> None:
+        self.play_turn(action)
+        with self.profiler.phase("update_fov"):
             self.update_fov()  # Update the FOV before the players next action.
 
+    def play_turn(self, action: Action) -> None:
+        """Perform the players action and let the monsters act, without updating the FOV."""
+        profiler = self.profiler
+        with profiler.phase("perform"):
+            action.perform(self, self.player)
+        with profiler.phase("enemy_turns"):
+            self.handle_enemy_turns()
+
     # algorithm = 2 circular
     # algorithm = 12 default
 
     def update_fov(self) -> None:
-        """Recompute the visible area based on the players point of view."""
-        self.game_map.visible[:] = compute_fov(
-            self.game_map.tiles["transparent"],
-            (self.player.x, self.player.y),
-            radius=10,
+        """Recompute the visible area based on the players point of view.
+
+        Only the (2r+1)² window around the player is computed and written, nothing further away can be visible.
+        """
+        game_map = self.game_map
+        game_map.mark_dirty(game_map.visible_window)  # Tiles that may stop being visible.
+        game_map.visible[game_map.visible_window] = False
+
+        game_map.visible_window = game_map.window_around(self.player.x, self.player.y, FOV_RADIUS)
+        game_map.visible[game_map.visible_window] = self.compute_fov_window(game_map.visible_window)
+        # If a tile is "visible" it should be added to "explored".
+        game_map.reveal(game_map.visible_window)
+        game_map.mark_dirty(game_map.visible_window)
+
+    def compute_fov_window(self, window: Tuple[slice, slice]) -> np.ndarray:
+        """Return the players FOV inside `window`, using the FOV cache when it is enabled."""
+        key = (self.player.x, self.player.y, self.game_map.revision)
+        if key in self.fov_cache:
+            self.fov_cache.move_to_end(key)
+            return self.fov_cache[key]
+
+        x_slice, y_slice = window
+        fov = compute_fov(
+            self.game_map.transparent[window],
+            (self.player.x - x_slice.start, self.player.y - y_slice.start),
+            radius=FOV_RADIUS,
             algorithm=2
         )
-        # If a tile is "visible" it should be added to "explored".
-        self.game_map.explored |= self.game_map.visible
+        if self.fov_cache_size > 0:
+            self.fov_cache[key] = fov
+            if len(self.fov_cache) > self.fov_cache_size:
+                self.fov_cache.popitem(last=False)
+        return fov
+
+    def draw(self, console: Console) -> None:
+        """Draw the current frame into `console` without presenting it."""
+        with self.profiler.phase("render"):
+            self.game_map.render(console, self.player)
+        # Next to the "% discovered" text.
+        self.profiler.draw(console, len(f"{self.game_map.percent_discovered} % discovered") + 2, 0)
 
     def render(self, console: Console, context: Context) -> None:
-        self.game_map.render(console, self.player)
-        console.print(self.player.x - self.game_map.camera_top_x, self.player.y - self.game_map.camera_top_y, self.player.char, fg = self.player.color)
-        context.present(console)
-        console.clear()
+        self.draw(console)
+        with self.profiler.phase("present"):
+            context.present(console)
@@ -1,6 +1,7 @@
 from data_classes.entity import Entity
+from data_classes.render_order import RenderOrder
 
-player = Entity(char="@", color=(255,20,147), name="Player", blocks_movement=True)
+player = Entity(char="@", color=(255,20,147), name="Player", blocks_movement=True, render_order=RenderOrder.PLAYER)
 
-orc = Entity(char="o", color=(63, 127, 63), name="Orc", blocks_movement=True)
-troll = Entity(char="T", color=(0, 127, 0), name="Troll", blocks_movement=True)
\ No newline at end of file
+orc = Entity(char="o", color=(63, 127, 63), name="Orc", blocks_movement=True, render_order=RenderOrder.ACTOR)
+troll = Entity(char="T", color=(0, 127, 0), name="Troll", blocks_movement=True, render_order=RenderOrder.ACTOR)
\ No newline at end of file
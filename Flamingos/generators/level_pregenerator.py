@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import copy
+import random
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from data_classes.game_map import GameMap
+from data_classes.save_format import pack_game_map, unpack_game_map
+from generators import entity_factories
+from generators.procgen import generate_dungeon
+
+
+def level_rng(seed: int, depth: int) -> random.Random:
+    """Return the RNG that level `depth` of the game started with `seed` is generated from.
+
+    The first level uses the seed as is, so seeds recorded before there were several levels still work.
+    """
+    return random.Random(seed if depth == 1 else f"{seed}:level:{depth}")
+
+
+def build_level(seed: int, depth: int, settings: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Generate one level and return it packed, ready to be sent back from a worker process.
+
+    `settings` are the keyword arguments for `generate_dungeon`, apart from the player and the RNG.
+    """
+    player = copy.deepcopy(entity_factories.player)
+    dungeon = generate_dungeon(player=player, rng=level_rng(seed, depth), **settings)
+    return pack_game_map(dungeon, player)
+
+
+class LevelPregenerator:
+    """Generates the levels below the current one in a process pool, ahead of the player.
+
+    Each level only depends on the game seed and its depth, so levels come out the same whether
+    they were generated ahead of time, in another process or on demand. With a `lookahead` of 0
+    there is no pool, every level is generated in this process when it is taken.
+    """
+
+    def __init__(self, seed: int, settings: Dict[str, Any], lookahead: int = 2, max_workers: Optional[int] = None):
+        self.seed = seed
+        self.settings = settings
+        self.lookahead = lookahead
+        self.pool = ProcessPoolExecutor(max_workers=max_workers or lookahead) if lookahead > 0 else None
+        self.pending: Dict[int, Future] = {}  # depth -> packed level
+
+    def prefetch(self, depth: int) -> None:
+        """Start generating the `lookahead` levels below `depth` that aren't already on their way."""
+        for next_depth in range(depth + 1, depth + self.lookahead + 1):
+            if next_depth not in self.pending:
+                self.pending[next_depth] = self.pool.submit(build_level, self.seed, next_depth, self.settings)
+
+    def take(self, depth: int) -> Tuple[GameMap, Tuple[int, int]]:
+        """Return level `depth` and the position its player should start at, waiting for it if it isn't done.
+
+        Levels above `depth` are forgotten and the ones below it are started.
+        """
+        if self.pool is None:
+            packed = build_level(self.seed, depth, self.settings)
+        else:
+            future = self.pending.pop(depth, None)
+            if future is None:
+                future = self.pool.submit(build_level, self.seed, depth, self.settings)
+            for old_depth in [d for d in self.pending if d < depth]:
+                self.pending.pop(old_depth).cancel()
+            self.prefetch(depth)
+            packed = future.result()
+
+        game_map, stand_in = unpack_game_map(packed)
+        # The level came with its own player, make room for the real one.
+        start = (stand_in.x, stand_in.y)
+        game_map.remove_entity(stand_in)
+        return game_map, start
+
+    def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)  # Levels already being built only take a moment.
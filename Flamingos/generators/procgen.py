@@ -1,10 +1,13 @@
 from __future__ import annotations
+import functools
+import heapq
+import itertools
 import random
 
-from typing import Iterator, Tuple, List, TYPE_CHECKING
+from typing import Callable, Iterator, Tuple, List, TYPE_CHECKING
 
 import numpy as np
-import tcod
+from data_classes.chunked_map import CHUNK_SIZE, ChunkedGameMap
 from data_classes.game_map import GameMap
 import data_classes.tile_types as tile_types
 from generators import entity_factories
@@ -41,70 +44,158 @@ class RectangularRoom:
         )
 
     def place_doors(self, dungeon: GameMap):
-        last_was_door = False
-        for x in range(self.x1, self.x2+1):
-            if dungeon.tiles[x][self.y1] == tile_types.wall:
-                last_was_door = False
-            if dungeon.tiles[x][self.y1] == tile_types.hallway and not last_was_door:
-                dungeon.tiles[x][self.y1] = tile_types.door
-                last_was_door = True
-        last_was_door = False
-        for x in range(self.x1, self.x2 + 1):
-            if dungeon.tiles[x][self.y2] == tile_types.wall:
-                last_was_door = False
-            if dungeon.tiles[x][self.y2] == tile_types.hallway and not last_was_door:
-                dungeon.tiles[x][self.y2] = tile_types.door
-                last_was_door = True
-        last_was_door = False
-        for y in range(self.y1, self.y2 + 1):
-            if dungeon.tiles[self.x1][y] == tile_types.wall:
-                last_was_door = False
-            if dungeon.tiles[self.x1][y] == tile_types.hallway and not last_was_door:
-                dungeon.tiles[self.x1][y] = tile_types.door
-                last_was_door = True
-        last_was_door = False
-        for y in range(self.y1, self.y2 + 1):
-            if dungeon.tiles[self.x2][y] == tile_types.wall:
-                last_was_door = False
-            if dungeon.tiles[self.x2][y] == tile_types.hallway and not last_was_door:
-                dungeon.tiles[self.x2][y] = tile_types.door
-                last_was_door = True
+        """Turn the first hallway tile of every wall-delimited run along each edge into a door."""
+        for edge in (
+                dungeon.tiles[self.x1:self.x2 + 1, self.y1],
+                dungeon.tiles[self.x1:self.x2 + 1, self.y2],
+                dungeon.tiles[self.x1, self.y1:self.y2 + 1],
+                dungeon.tiles[self.x2, self.y1:self.y2 + 1],
+        ):
+            # Every wall starts a new run, the first hallway tile of each run becomes a door.
+            run_ids = np.cumsum(edge == tile_types.wall)
+            hallway_indices = np.flatnonzero(edge == tile_types.hallway)
+            _, first_in_run = np.unique(run_ids[hallway_indices], return_index=True)
+            edge[hallway_indices[first_in_run]] = tile_types.door
+
+
+# Chooses where rooms go: (map_width, map_height, max_rooms, room_min_size, room_max_size, rng) -> rooms.
+# Rooms are yielded one at a time and must not intersect each other.
+RoomPlacement = Callable[[int, int, int, int, int, random.Random], Iterator[RectangularRoom]]
+
+
+def random_rooms(
+        map_width: int,
+        map_height: int,
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        rng: random.Random,
+) -> Iterator[RectangularRoom]:
+    """Try `max_rooms` random rooms, keeping the ones that don't overlap a room kept before.
+
+    Every attempt is checked against every kept room, and attempts fail more often as the map fills up,
+    so this is meant for a few dozen rooms. Rooms are yielded before the next attempt is drawn, so the
+    caller's own draws from `rng` happen in between, like they did before placement was pluggable.
+    """
+    rooms: List[RectangularRoom] = []
+
+    for r in range(max_rooms):
+        room_width = rng.randint(room_min_size, room_max_size)
+        room_height = rng.randint(room_min_size, room_max_size)
+
+        x = rng.randint(0, map_width - room_width - 1)
+        y = rng.randint(0, map_height - room_height - 1)
+
+        # "RectangularRoom" class makes rectangles easier to work with
+        new_room = RectangularRoom(x, y, room_width, room_height)
+
+        # Run through the other rooms and see if they intersect with this one.
+        if any(new_room.intersects(other_room) for other_room in rooms):
+            continue  # This room intersects, so go to the next attempt.
+        # If there are no intersections then the room is valid.
+        rooms.append(new_room)
+        yield new_room
+
+
+def bsp_rooms(
+        map_width: int,
+        map_height: int,
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        rng: random.Random,
+) -> Iterator[RectangularRoom]:
+    """Split the map into up to `max_rooms` partitions and put one room in each.
+
+    The largest partition is split until there are `max_rooms` of them or none is big enough to
+    hold two rooms, so the map fills evenly and no attempt is ever wasted: O(n log n) for n rooms.
+    Rooms are yielded in partition order, neighbouring rooms come one after the other and the
+    tunnels between them stay short.
+    """
+    # A room of width w covers w + 1 columns, its walls included, and rooms in neighbouring
+    # partitions may not touch.
+    min_length = room_min_size + 1
+    if map_width < min_length or map_height < min_length or max_rooms < 1:
+        return
+
+    # Partitions are [x, y, width, height, next partition] in a linked list, which keeps them in
+    # spatial order as they are split. The heap hands out the biggest partition first.
+    first = [0, 0, map_width, map_height, None]
+    order = itertools.count()
+    heap = [(-map_width * map_height, next(order), first)]
+    partitions = 1
+    while heap and partitions < max_rooms:
+        _, _, partition = heapq.heappop(heap)
+        x, y, width, height, following = partition
+        can_split_x, can_split_y = width >= 2 * min_length, height >= 2 * min_length
+        if not can_split_x and not can_split_y:
+            continue  # Too small, it keeps its single room.
+
+        if can_split_x and (width >= height or not can_split_y):
+            cut = rng.randint(min_length, width - min_length)
+            partition[2] = cut
+            second = [x + cut, y, width - cut, height, following]
+        else:
+            cut = rng.randint(min_length, height - min_length)
+            partition[3] = cut
+            second = [x, y + cut, width, height - cut, following]
+        partition[4] = second
+        partitions += 1
+        for part in (partition, second):
+            heapq.heappush(heap, (-part[2] * part[3], next(order), part))
+
+    partition = first
+    while partition is not None:
+        x, y, width, height, partition = partition
+        room_width = rng.randint(room_min_size, min(room_max_size, width - 1))
+        room_height = rng.randint(room_min_size, min(room_max_size, height - 1))
+        yield RectangularRoom(
+            rng.randint(x, x + width - 1 - room_width),
+            rng.randint(y, y + height - 1 - room_height),
+            room_width,
+            room_height,
+        )
 
 
 def place_entities(
-    room: RectangularRoom, dungeon: GameMap, maximum_monsters: int,
+    room: RectangularRoom, dungeon: GameMap, maximum_monsters: int, rng: random.Random,
 ) -> None:
-    number_of_monsters = random.randint(1, maximum_monsters)
+    number_of_monsters = rng.randint(1, maximum_monsters)
 
     for i in range(number_of_monsters):
-        x = random.randint(room.x1 + 1, room.x2 - 1)
-        y = random.randint(room.y1 + 1, room.y2 - 1)
+        x = rng.randint(room.x1 + 1, room.x2 - 1)
+        y = rng.randint(room.y1 + 1, room.y2 - 1)
 
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities):
-            if random.random() < 0.8:
-                entity_factories.orc.spawn(dungeon, x, y)
+        if not dungeon.get_entities_at_location(x, y):
+            if rng.random() < 0.8:
+                dungeon.spawn(entity_factories.orc, x, y)
             else:
-                entity_factories.troll.spawn(dungeon, x, y)
+                dungeon.spawn(entity_factories.troll, x, y)
 
 
-def tunnel_between(
-        start: Tuple[int, int], end: Tuple[int, int]
-) -> Iterator[Tuple[int, int]]:
-    """Return an L-shaped tunnel between these two points."""
+def tunnel_legs(
+        start: Tuple[int, int], end: Tuple[int, int], rng: random.Random
+) -> Tuple[Tuple[Tuple[int, int], Tuple[int, int]], Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """Return the two straight legs, as (from, to) points, of an L-shaped tunnel between these two points."""
     x1, y1 = start
     x2, y2 = end
-    if random.random() < 0.5:  # 50% chance.
+    if rng.random() < 0.5:  # 50% chance.
         # Move horizontally, then vertically.
         corner_x, corner_y = x2, y1
     else:
         # Move vertically, then horizontally.
         corner_x, corner_y = x1, y2
+    return ((x1, y1), (corner_x, corner_y)), ((corner_x, corner_y), (x2, y2))
+
 
-    # Generate the coordinates for this tunnel.
-    for x, y in tcod.los.bresenham((x1, y1), (corner_x, corner_y)).tolist():
-        yield x, y
-    for x, y in tcod.los.bresenham((corner_x, corner_y), (x2, y2)).tolist():
-        yield x, y
+def carve_tunnel(dungeon: GameMap, start: Tuple[int, int], end: Tuple[int, int], rng: random.Random) -> None:
+    """Dig an L-shaped hallway between two points, leaving non-wall tiles untouched.
+
+    Each straight leg is carved as an array slice.
+    """
+    for (ax, ay), (bx, by) in tunnel_legs(start, end, rng):
+        leg = dungeon.tiles[min(ax, bx):max(ax, bx) + 1, min(ay, by):max(ay, by) + 1]
+        leg[leg == tile_types.wall] = tile_types.hallway
 
 
 def generate_dungeon(
@@ -115,53 +206,132 @@ def generate_dungeon(
         map_width: int,
         map_height: int,
         player: Entity,
+        rng: random.Random,
+        room_placement: RoomPlacement = random_rooms,
 ) -> GameMap:
-    """Generate a new dungeon map."""
-    dungeon = GameMap(map_width, map_height, entities=[player])
-
-    rooms: List[RectangularRoom] = []
-
-    for r in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
+    """Generate a new dungeon map.
 
-        x = random.randint(0, dungeon.width - room_width - 1)
-        y = random.randint(0, dungeon.height - room_height - 1)
-
-        # "RectangularRoom" class makes rectangles easier to work with
-        new_room = RectangularRoom(x, y, room_width, room_height)
+    Every random choice is drawn from `rng`, so a `random.Random(seed)` always gives the same dungeon.
+    `room_placement` decides where the rooms go, use `bsp_rooms` for hundreds or thousands of rooms.
+    """
+    dungeon = GameMap(map_width, map_height)
 
-        # Run through the other rooms and see if they intersect with this one.
-        if any(new_room.intersects(other_room) for other_room in rooms):
-            continue  # This room intersects, so go to the next attempt.
-        # If there are no intersections then the room is valid.
+    rooms: List[RectangularRoom] = []
 
+    for new_room in room_placement(map_width, map_height, max_rooms, room_min_size, room_max_size, rng):
         # Dig out this room's inner area.
         dungeon.tiles[new_room.inner] = tile_types.floor
-        place_entities(new_room, dungeon, max_monsters_per_room)
+        place_entities(new_room, dungeon, max_monsters_per_room, rng)
         if len(rooms) == 0:
             # The first room, where the player starts.
-            player.x, player.y = new_room.center
+            player.place(*new_room.center, dungeon)
         else:  # All rooms after the first.
             # Dig out a tunnel between this room and the previous one.
-
-            # BUGGY CODE TO ADD DOORS, DELETE ALL LINES FROM 99-115 BUT KEEP LINE 112
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                if dungeon.tiles[x, y] == tile_types.wall:
-                    dungeon.tiles[x, y] = tile_types.hallway
+            carve_tunnel(dungeon, rooms[-1].center, new_room.center, rng)
 
         # Finally, append the new room to the list.
         rooms.append(new_room)
     for room in rooms:
         room.place_doors(dungeon)
 
-    for x in range(0, dungeon.width):
-        for y in range(0, dungeon.height):
-            if dungeon.tiles[x][y] == tile_types.floor:
-                dungeon.is_floor[x][y] = True
+    # Hallways used to be indistinguishable from room floor, they have always counted as discoverable.
+    dungeon.is_floor[:] = np.isin(dungeon.tiles, (tile_types.floor, tile_types.hallway))
+    dungeon.mark_tiles_changed()
     dungeon.total_discoverable_tiles = np.count_nonzero(dungeon.is_floor)
     return dungeon
 
+
+def chunk_portal(seed: int, edge: str, chunk_x: int, chunk_y: int) -> int:
+    """Return where the corridor crosses an edge between two chunks, as an offset along that edge.
+
+    `edge` is "v" for the left edge of chunk (chunk_x, chunk_y) and "h" for its top edge. Both
+    chunks sharing the edge get the same answer, so their corridors meet.
+    """
+    return random.Random(f"{seed}:{edge}:{chunk_x}:{chunk_y}").randint(CHUNK_SIZE // 3, CHUNK_SIZE * 2 // 3)
+
+
+def generate_chunk(
+        chunk_x: int,
+        chunk_y: int,
+        *,
+        seed: int,
+        chunks_wide: int,
+        chunks_tall: int,
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        max_monsters_per_room: int,
+) -> GameMap:
+    """Generate one chunk of a `ChunkedGameMap`, in chunk-local coordinates.
+
+    The same seed and chunk always give the same result, so evicted chunks can be regenerated.
+    """
+    dungeon = GameMap(CHUNK_SIZE, CHUNK_SIZE)
+    rooms: List[RectangularRoom] = []
+
+    rng = random.Random(f"{seed}:chunk:{chunk_x}:{chunk_y}")
+    for new_room in random_rooms(CHUNK_SIZE, CHUNK_SIZE, max_rooms, room_min_size, room_max_size, rng):
+        dungeon.tiles[new_room.inner] = tile_types.floor
+        place_entities(new_room, dungeon, max_monsters_per_room, rng)
+        if rooms:
+            carve_tunnel(dungeon, rooms[-1].center, new_room.center, rng)
+        rooms.append(new_room)
+
+    # Connect the first room to the corridors of the neighbouring chunks.
+    portals = []
+    if chunk_x > 0:
+        portals.append((0, chunk_portal(seed, "v", chunk_x, chunk_y)))
+    if chunk_x + 1 < chunks_wide:
+        portals.append((CHUNK_SIZE - 1, chunk_portal(seed, "v", chunk_x + 1, chunk_y)))
+    if chunk_y > 0:
+        portals.append((chunk_portal(seed, "h", chunk_x, chunk_y), 0))
+    if chunk_y + 1 < chunks_tall:
+        portals.append((chunk_portal(seed, "h", chunk_x, chunk_y + 1), CHUNK_SIZE - 1))
+    for portal in portals:
+        carve_tunnel(dungeon, rooms[0].center, portal, rng)
+
+    for room in rooms:
+        room.place_doors(dungeon)
+    dungeon.is_floor[:] = np.isin(dungeon.tiles, (tile_types.floor, tile_types.hallway))
+    return dungeon
+
+
+def generate_chunked_dungeon(
+        max_rooms_per_chunk: int,
+        room_min_size: int,
+        room_max_size: int,
+        max_monsters_per_room: int,
+        map_width: int,
+        map_height: int,
+        player: Entity,
+        seed: int,
+        max_hot_chunks: int = 64,
+) -> ChunkedGameMap:
+    """Create a world that is generated a chunk at a time, and place the player near its middle."""
+    generator = functools.partial(
+        generate_chunk,
+        seed=seed,
+        chunks_wide=-(-map_width // CHUNK_SIZE),
+        chunks_tall=-(-map_height // CHUNK_SIZE),
+        max_rooms=max_rooms_per_chunk,
+        room_min_size=room_min_size,
+        room_max_size=room_max_size,
+        max_monsters_per_room=max_monsters_per_room,
+    )
+    dungeon = ChunkedGameMap(map_width, map_height, generator, max_hot_chunks=max_hot_chunks)
+
+    # Start on the free floor tile closest to the middle of the middle chunk.
+    left = min(map_width // 2 // CHUNK_SIZE * CHUNK_SIZE, map_width - 1)
+    top = min(map_height // 2 // CHUNK_SIZE * CHUNK_SIZE, map_height - 1)
+    window = (slice(left, left + CHUNK_SIZE), slice(top, top + CHUNK_SIZE))
+    floor = np.argwhere(dungeon.is_floor[window]) + (left, top)
+    middle = (left + CHUNK_SIZE // 2, top + CHUNK_SIZE // 2)
+    for x, y in sorted(floor.tolist(), key=lambda xy: abs(xy[0] - middle[0]) + abs(xy[1] - middle[1])):
+        if not dungeon.get_entities_at_location(x, y):
+            player.place(x, y, dungeon)
+            break
+    return dungeon
+
 # doesnt work pls dont use
 
 
@@ -182,8 +352,7 @@ def generate_dungeon_2(
     first_room_x = int(map_width / 2 - room_width / 2)
     first_room_y = int(map_height / 2 - room_height / 2)
 
-    player.x = int(map_width / 2)
-    player.y = int(map_height / 2)
+    player.place(int(map_width / 2), int(map_height / 2), dungeon)
 
     new_room = RectangularRoom(first_room_x, first_room_y, room_width, room_height)
     dungeon.tiles[new_room.inner] = tile_types.floor
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Run the engine without a window, replaying recorded or scripted input.
+
+Sessions recorded with `main.py --record FILE` can be replayed with `--replay FILE`,
+otherwise a seeded random walk is generated. The dungeon and the input are both
+derived from the seed, so two runs with the same arguments play out identically.
+"""
+import argparse
+import contextlib
+import json
+import random
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Union
+
+import tcod
+
+from actions import Action
+from engine import Engine
+from main import SCREEN_HEIGHT, SCREEN_WIDTH, new_game
+from profiler import FrameProfiler
+
+MOVE_SYMS = [tcod.event.K_UP, tcod.event.K_DOWN, tcod.event.K_LEFT, tcod.event.K_RIGHT]
+
+Step = Union[Action, tcod.event.Event, List[tcod.event.Event]]
+
+
+def key_events(keys: Iterable[Union[int, List[int]]]) -> List[tcod.event.KeyDown]:
+    """Turn the [sym, mod] pairs written by `main.py --record` into key press events.
+
+    Plain key codes, as in older recordings, are pressed without modifiers.
+    """
+    events = []
+    for key in keys:
+        sym, mod = (key, 0) if isinstance(key, int) else key
+        events.append(tcod.event.KeyDown(scancode=0, sym=sym, mod=mod))
+    return events
+
+
+def load_recording(path: str) -> Dict:
+    """Load a session written by `main.py --record`. Returns its seed, map kind and key events.
+
+    The events are grouped into the batches they were handled in, if the recording has them.
+    """
+    with open(path) as f:
+        recording = json.load(f)
+    events: List[Step] = key_events(recording["keys"])
+    if "batches" in recording:
+        batches = []
+        start = 0
+        for size in recording["batches"]:
+            batches.append(events[start:start + size])
+            start += size
+        events = batches
+    return {
+        "seed": recording["seed"],
+        "chunked": recording.get("chunked", False),
+        "events": events,
+    }
+
+
+def random_walk(turns: int, seed: int) -> List[tcod.event.KeyDown]:
+    """Script `turns` arrow key presses chosen by a seeded RNG."""
+    rng = random.Random(seed)
+    return key_events(rng.choice(MOVE_SYMS) for _ in range(turns))
+
+
+def replay(engine: Engine, steps: Iterable[Step], console: Optional[tcod.Console] = None) -> Dict[str, float]:
+    """Feed `steps` to `engine` one at a time, drawing a frame into `console` before each step.
+
+    Steps can be input events or lists of events handled as one batch, which go through
+    `Engine.handle_events`, or actions, which are performed for the player directly. Pass no console to time the turn loop on its own.
+    Returns the number of turns played and frames drawn, and how many of each were processed per second.
+    Events that don't map to an action don't count as turns, a batch counts as many turns as it played.
+    """
+    turns = frames = 0
+    turn_time = frame_time = 0.0
+    try:
+        for step in steps:
+            if console is not None:
+                start = time.perf_counter()
+                engine.draw(console)
+                frame_time += time.perf_counter() - start
+                frames += 1
+
+            start = time.perf_counter()
+            if isinstance(step, Action):
+                engine.handle_action(step)
+                played = 1
+            else:
+                played = engine.handle_events(step if isinstance(step, list) else [step])
+            turn_time += time.perf_counter() - start
+            turns += played
+    except SystemExit:  # The session ended with an EscapeAction.
+        pass
+
+    return {
+        "turns": turns,
+        "frames": frames,
+        "turn_seconds": turn_time,
+        "frame_seconds": frame_time,
+        "turns_per_second": turns / turn_time if turn_time else 0.0,
+        "frames_per_second": frames / frame_time if frame_time else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a session without opening a window.")
+    parser.add_argument("--seed", type=int, default=0, help="Dungeon and random walk seed.")
+    parser.add_argument("--turns", type=int, default=1000, help="Length of the random walk.")
+    parser.add_argument("--replay", default=None, help="Session recorded with main.py --record.")
+    parser.add_argument("--no-render", action="store_true", help="Only time the turn loop.")
+    parser.add_argument("--chunked", action="store_true", help="Play a chunked world instead of a single dungeon.")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace of the session to this file.")
+    parser.add_argument("--lookahead", type=int, default=0, help="Levels to generate ahead in worker processes, 0 generates them on demand.")
+    args = parser.parse_args()
+
+    if args.replay:
+        recording = load_recording(args.replay)
+        seed, chunked, events = recording["seed"], recording["chunked"], recording["events"]
+    else:
+        seed, chunked, events = args.seed, args.chunked, random_walk(args.turns, args.seed)
+
+    engine = new_game(seed, chunked=chunked, lookahead=args.lookahead)
+    engine.profiler = FrameProfiler(enabled=args.trace is not None, trace=True)
+    console = None if args.no_render else tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+    try:
+        with contextlib.redirect_stdout(sys.stderr):  # Keep the game's messages out of the JSON report.
+            results = replay(engine, events, console)
+    finally:
+        if engine.levels is not None:
+            engine.levels.shutdown()
+    if args.trace:
+        engine.profiler.export_trace(args.trace)
+        results["phases"] = engine.profiler.summary()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,23 @@
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
 import tcod.event
-from actions import Action, BumpAction, EscapeAction
+from actions import Action, AscendAction, BumpAction, DescendAction, EscapeAction
+
+MOVE_KEYS: Dict[int, Tuple[int, int]] = {
+    tcod.event.K_UP: (0, -1),
+    tcod.event.K_DOWN: (0, 1),
+    tcod.event.K_LEFT: (-1, 0),
+    tcod.event.K_RIGHT: (1, 0),
+}
+
+KEY_ACTIONS: Dict[int, Callable[[], Action]] = {
+    tcod.event.K_ESCAPE: EscapeAction,
+}
+
+# Keys that only do something while shift is held, like ">" which is shift + "." on most layouts.
+SHIFT_KEY_ACTIONS: Dict[int, Callable[[], Action]] = {
+    tcod.event.K_PERIOD: DescendAction,
+    tcod.event.K_COMMA: AscendAction,
+}
 
 
 class EventHandler(tcod.event.EventDispatch[Action]):
@@ -8,19 +25,13 @@ class EventHandler(tcod.event.EventDispatch[Action]):
         return EscapeAction()
 
     def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[Action]:
-        action: Optional[Action] = None
         key = event.sym
-        if key == tcod.event.K_UP:
-            action = BumpAction(dx=0, dy=-1)
-        elif key == tcod.event.K_DOWN:
-            action = BumpAction(dx=0, dy=1)
-        elif key == tcod.event.K_LEFT:
-            action = BumpAction(dx=-1, dy=0)
-        elif key == tcod.event.K_RIGHT:
-            action = BumpAction(dx=1, dy=0)
-
-        elif key == tcod.event.K_ESCAPE:
-            action = EscapeAction()
+        if key in MOVE_KEYS:
+            return BumpAction(*MOVE_KEYS[key])
+        if event.mod & tcod.event.KMOD_SHIFT and key in SHIFT_KEY_ACTIONS:
+            return SHIFT_KEY_ACTIONS[key]()
+        if key in KEY_ACTIONS:
+            return KEY_ACTIONS[key]()
 
         # No valid key was pressed
-        return action
+        return None
@@ -1,66 +1,163 @@
 #!/usr/bin/env python3
+import argparse
+import json
+import random
 import tcod
 import time
 import copy
+from typing import List, Optional
 from engine import Engine
 from generators import  entity_factories
 from input_handlers import EventHandler
-from generators.procgen import generate_dungeon
+from generators.level_pregenerator import LevelPregenerator, level_rng
+from generators.procgen import generate_chunked_dungeon, generate_dungeon
+from data_classes.save_format import load_game_map, save_game_map
+from profiler import FrameProfiler
 
 ART_PATH = 'Assets/Art/'
 
+SCREEN_WIDTH = 120
+MAP_WIDTH = SCREEN_WIDTH * 2
+SCREEN_HEIGHT = 80
+MAP_HEIGHT = SCREEN_HEIGHT * 2
+MAX_MONSTERS_PER_ROOM = 2
+ROOM_MAX_SIZE = 30
+ROOM_MIN_SIZE = 15
+MAX_ROOMS = 30
+# generate_dungeon settings shared by every level.
+LEVEL_SETTINGS = dict(
+    max_rooms=MAX_ROOMS,
+    room_min_size=ROOM_MIN_SIZE,
+    room_max_size=ROOM_MAX_SIZE,
+    max_monsters_per_room=MAX_MONSTERS_PER_ROOM,
+    map_width=MAP_WIDTH,
+    map_height=MAP_HEIGHT,
+)
+# Levels generated ahead of the player in the background.
+LEVEL_LOOKAHEAD = 2
 
-def main() -> None:
-    screen_width = 120
-    map_width = screen_width * 2
-    screen_height = 80
-    map_height = screen_height * 2
-    max_monsters_per_room = 2
-    room_max_size = 30
-    room_min_size = 15
-    max_rooms = 30
+# Settings for the --chunked world, which is generated a chunk at a time around the camera.
+CHUNKED_MAP_SIZE = 10_000
+CHUNK_MAX_ROOMS = 8
+CHUNK_ROOM_MIN_SIZE = 6
+CHUNK_ROOM_MAX_SIZE = 16
 
-    tileset = tcod.tileset.load_tilesheet(
-        ART_PATH + "dejavu10x10_gs_tc.png", 32, 8, tcod.tileset.CHARMAP_TCOD
-    )
+
+def new_game(seed: Optional[int] = None, chunked: bool = False, lookahead: int = 0) -> Engine:
+    """Generate a fresh dungeon and return an engine ready to play it.
+
+    Passing a `seed` makes the dungeon (and so a recorded session) reproducible. With a `lookahead`
+    the next levels are generated in worker processes while the first one is played, without one
+    they are generated when the player gets there.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
     event_handler = EventHandler()
     player = copy.deepcopy(entity_factories.player)
 
-    game_map = generate_dungeon(
-        max_rooms=max_rooms,
-        room_min_size=room_min_size,
-        room_max_size=room_max_size,
-        max_monsters_per_room=max_monsters_per_room,
-        map_width=map_width,
-        map_height=map_height,
-        player=player
-    )
+    if chunked:
+        game_map = generate_chunked_dungeon(
+            max_rooms_per_chunk=CHUNK_MAX_ROOMS,
+            room_min_size=CHUNK_ROOM_MIN_SIZE,
+            room_max_size=CHUNK_ROOM_MAX_SIZE,
+            max_monsters_per_room=MAX_MONSTERS_PER_ROOM,
+            map_width=CHUNKED_MAP_SIZE,
+            map_height=CHUNKED_MAP_SIZE,
+            player=player,
+            seed=seed,
+        )
+        return Engine(event_handler=event_handler, game_map=game_map, player=player)
+
+    game_map = generate_dungeon(player=player, rng=level_rng(seed, 1), **LEVEL_SETTINGS)
 
     # game_map = generate_dungeon_2(
-    #     room_min_size=room_min_size,
-    #     room_max_size=room_max_size,
-    #     map_width=map_width,
-    #     map_height=map_height,
+    #     room_min_size=ROOM_MIN_SIZE,
+    #     room_max_size=ROOM_MAX_SIZE,
+    #     map_width=MAP_WIDTH,
+    #     map_height=MAP_HEIGHT,
     #     player=player
     # )
 
-    engine = Engine(event_handler=event_handler, game_map=game_map, player=player)
+    levels = LevelPregenerator(seed, LEVEL_SETTINGS, lookahead=lookahead)
+    return Engine(event_handler=event_handler, game_map=game_map, player=player, levels=levels)
+
+
+def load_game(path: str) -> Engine:
+    """Continue a level written by `--save`."""
+    game_map, player = load_game_map(path)
+    if player is None:
+        raise ValueError(f"{path} doesn't contain a player.")
+    return Engine(event_handler=EventHandler(), game_map=game_map, player=player)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Yet Another Roguelike Tutorial with flamingos!")
+    parser.add_argument("--seed", type=int, default=None, help="Seed used to generate the dungeon.")
+    parser.add_argument("--record", default=None, help="Write the key presses of this session to a file for headless.py.")
+    parser.add_argument("--chunked", action="store_true", help=f"Play a {CHUNKED_MAP_SIZE}x{CHUNKED_MAP_SIZE} chunked world.")
+    parser.add_argument("--save", default=None, help="Save the level to this .npz file when the game closes.")
+    parser.add_argument("--load", default=None, help="Continue a level saved with --save.")
+    parser.add_argument("--profile", action="store_true", help="Show how long each phase of a frame takes.")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace of every frame to this file when the game closes.")
+    args = parser.parse_args()
+    if args.save and args.chunked:
+        parser.error("--save doesn't support chunked worlds.")
+    if args.record and args.load:
+        parser.error("--record replays from the seed, it can't record a game continued with --load.")
+
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    recorded_keys: List[List[int]] = []  # [sym, mod] pairs, the modifiers pick actions like descending.
+    recorded_batches: List[int] = []  # Keys per handle_events call, so replays batch them the same way.
+
+    tileset = tcod.tileset.load_tilesheet(
+        ART_PATH + "dejavu10x10_gs_tc.png", 32, 8, tcod.tileset.CHARMAP_TCOD
+    )
+    if args.load:
+        engine = load_game(args.load)
+    else:
+        engine = new_game(seed, chunked=args.chunked, lookahead=0 if args.chunked else LEVEL_LOOKAHEAD)
+    engine.profiler = FrameProfiler(
+        enabled=args.profile or args.trace is not None,
+        trace=args.trace is not None,
+        overlay=args.profile,
+    )
 
     with tcod.context.new_terminal(
-            screen_width,
-            screen_height,
+            SCREEN_WIDTH,
+            SCREEN_HEIGHT,
             tileset=tileset,
             title="Yet Another Roguelike Tutorial with flamingos!",
             vsync=True,
     ) as context:
-        root_console = tcod.Console(screen_width, screen_height, order="F")
-
-        while True:
-            #start_time = time.time()  # start time of the loop
-            engine.render(console=root_console, context=context)
-            events = tcod.event.wait()
-            engine.handle_events(events)
-            #print("FPS: ", 1.0 / (time.time() - start_time))
+        root_console = tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+
+        try:
+            changed = True
+            while True:
+                #start_time = time.time()  # start time of the loop
+                if changed:
+                    engine.render(console=root_console, context=context)
+                # Everything queued up since the last frame is handled as one batch.
+                events = list(tcod.event.wait())
+                if args.record:
+                    keys = [[int(event.sym), int(event.mod)] for event in events if isinstance(event, tcod.event.KeyDown)]
+                    if keys:
+                        recorded_keys.extend(keys)
+                        recorded_batches.append(len(keys))
+                changed = engine.handle_events(events) > 0
+                # The window may need a redraw even if the game didn't change.
+                changed = changed or any(isinstance(event, tcod.event.WindowEvent) for event in events)
+                #print("FPS: ", 1.0 / (time.time() - start_time))
+        finally:
+            if args.trace:
+                engine.profiler.export_trace(args.trace)
+            if engine.levels is not None:
+                engine.levels.shutdown()
+            if args.save:
+                save_game_map(args.save, engine.game_map, engine.player)
+            if args.record:
+                with open(args.record, "w") as f:
+                    json.dump({"seed": seed, "chunked": args.chunked, "keys": recorded_keys, "batches": recorded_batches}, f)
 
 
 if __name__ == "__main__":
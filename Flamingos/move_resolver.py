@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import List, NamedTuple, Sequence, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from data_classes.entity import Entity
+    from data_classes.game_map import GameMap
+
+
+class MoveResult(NamedTuple):
+    moved: np.ndarray  # Mask of the entities that moved
+    attackers: List[Entity]  # Entities whose step ran into the target, in order
+
+
+def resolve_moves(
+        game_map: GameMap,
+        entities: Sequence[Entity],
+        dx: np.ndarray,
+        dy: np.ndarray,
+        target: Entity,
+) -> MoveResult:
+    """Move many entities at once, each one step by (dx, dy), the way MovementAction would.
+
+    Bounds, walkability and occupancy are checked for all of them together. Steps onto `target`
+    are melee attacks instead, they are returned for the caller to perform. When several
+    entities want the same tile, the first one in `entities` gets it. A tile left by a mover is
+    free for the others, so a line of monsters following each other moves up as one.
+    """
+    if not len(entities):
+        return MoveResult(np.zeros(0, dtype=bool), [])
+    store = game_map.entity_store
+    rows = np.fromiter((entity.index for entity in entities), dtype=np.intp, count=len(entities))
+    xs, ys = store.x[rows], store.y[rows]
+    dest_x, dest_y = xs + dx, ys + dy
+
+    wants_to_move = (dx != 0) | (dy != 0)
+    attacks = wants_to_move & (dest_x == target.x) & (dest_y == target.y)
+    in_bounds = (dest_x >= 0) & (dest_x < game_map.width) & (dest_y >= 0) & (dest_y < game_map.height)
+
+    moved = np.zeros(len(entities), dtype=bool)
+    movers = np.flatnonzero(wants_to_move & ~attacks & in_bounds)
+    if len(movers):
+        # Walkability and occupancy are looked up in the area the moves touch, chunked maps only index by slices.
+        x1 = min(xs[movers].min(), dest_x[movers].min())
+        y1 = min(ys[movers].min(), dest_y[movers].min())
+        x2 = max(xs[movers].max(), dest_x[movers].max()) + 1
+        y2 = max(ys[movers].max(), dest_y[movers].max()) + 1
+        src_x, src_y = xs - x1, ys - y1
+        dst_x, dst_y = dest_x - x1, dest_y - y1
+        movers = movers[game_map.walkable[x1:x2, y1:y2][dst_x[movers], dst_y[movers]]]
+
+        # Only entities that block movement occupy their tile. Read from the occupancy index, so
+        # the cost depends on the area the moves touch rather than everyone on the map.
+        occupants = game_map.occupants[x1:x2, y1:y2]
+        occupied = np.zeros(occupants.shape, dtype=bool)
+        tile_x, tile_y = np.nonzero(occupants >= 0)
+        tile_rows = occupants[tile_x, tile_y]
+        while len(tile_rows):
+            occupied[tile_x, tile_y] |= store.blocks_movement[tile_rows]
+            tile_rows = store.next_at[tile_rows]
+            more = tile_rows >= 0
+            tile_x, tile_y, tile_rows = tile_x[more], tile_y[more], tile_rows[more]
+
+        dst_keys = dst_x.astype(np.int64) * (y2 - y1) + dst_y
+        blocks = store.blocks_movement[rows]
+        while len(movers):
+            candidates = movers[~occupied[dst_x[movers], dst_y[movers]]]
+            if not len(candidates):
+                break
+            # First come, first served. np.unique returns the first index of every destination.
+            _, first = np.unique(dst_keys[candidates], return_index=True)
+            winners = candidates[first]
+            moved[winners] = True
+            blocking = winners[blocks[winners]]
+            occupied[src_x[blocking], src_y[blocking]] = False
+            occupied[dst_x[blocking], dst_y[blocking]] = True
+            # Losers stay, they get in if their tile is freed again or was taken by a non-blocking mover.
+            movers = movers[~moved[movers]]
+
+    if moved.any():
+        game_map.move_entities([entities[i] for i in np.flatnonzero(moved)], dest_x[moved], dest_y[moved])
+    return MoveResult(moved, [entities[i] for i in np.flatnonzero(attacks)])
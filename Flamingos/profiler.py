@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import time
+from collections import deque
+from typing import ContextManager, Deque, Dict, List, Optional, Sequence
+
+import numpy as np
+from tcod.console import Console
+
+# Returned by `FrameProfiler.phase` while profiling is off, so a disabled phase costs one call.
+_NOT_TIMED = contextlib.nullcontext()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: FrameProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+
+
+class FrameProfiler:
+    """Times the phases of a frame: input dispatch, actions, enemy turns, FOV, rendering and presenting.
+
+    Keeps the last `window` durations of every phase for percentiles, and with `trace` every
+    phase as a Chrome trace event, which chrome://tracing and speedscope can open. `overlay`
+    draws the percentiles on screen.
+    """
+
+    def __init__(
+            self,
+            enabled: bool = False,
+            window: int = 300,
+            trace: bool = False,
+            overlay: bool = False,
+            max_trace_events: int = 1_000_000,
+    ):
+        self.enabled = enabled
+        self.overlay = overlay
+        self.window = window
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self.samples: Dict[str, Deque[int]] = {}  # phase -> last durations in nanoseconds
+        self.trace_events: List[dict] = []
+        self._origin = time.perf_counter_ns()
+
+    def phase(self, name: str) -> ContextManager[None]:
+        """Return a context manager that times the code inside it as phase `name`."""
+        if not self.enabled:
+            return _NOT_TIMED
+        return _Phase(self, name)
+
+    def record(self, name: str, start: int, end: int) -> None:
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append(end - start)
+        if self.trace and len(self.trace_events) < self.max_trace_events:
+            self.trace_events.append({
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": 0,
+                "tid": 0,
+            })
+
+    def percentiles(self, name: str, q: Sequence[float] = (50, 95, 99)) -> Optional[np.ndarray]:
+        """Return the given percentiles of the recent durations of phase `name` in milliseconds, None if it never ran."""
+        samples = self.samples.get(name)
+        if not samples:
+            return None
+        return np.percentile(np.fromiter(samples, dtype=np.int64, count=len(samples)), q) / 1e6
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the p50, p95 and p99 in milliseconds of every phase."""
+        return {
+            name: dict(zip(("p50", "p95", "p99"), self.percentiles(name).tolist()))
+            for name in self.samples
+        }
+
+    def draw(self, console: Console, x: int, y: int) -> None:
+        """Print the median and 95th percentile of every phase in one line, starting at (x, y)."""
+        if not (self.enabled and self.overlay):
+            return
+        parts = []
+        for name in self.samples:
+            p50, p95 = self.percentiles(name, (50, 95))
+            parts.append(f"{name} {p50:.1f}/{p95:.1f}")
+        console.print(x, y, "  ".join(parts) + " ms", fg=(255, 255, 0))
+
+    def export_trace(self, path: str) -> None:
+        """Write the recorded phases as a Chrome trace file."""
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, f)
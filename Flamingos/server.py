@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Host many games from one process over a local socket.
+
+Every connection gets its own `Engine` on the same level. The level is generated once and
+its tiles are shared read-only between the sessions, only the FOV, the explored tiles and
+the entities are per session. The tile tables in `tile_types` are module level and so
+shared as well, the tileset isn't needed here at all, clients draw with their own.
+
+Protocol, per connection:
+    client -> server: one JSON object per line, {"keys": [[sym, mod], ...]}, handled as one batch.
+    server -> client: a frame on connecting and after every batch, each a 4-byte big-endian
+                      length followed by `CELL_DT` records for the console cells that changed
+                      since the previous frame. The first frame holds every cell.
+
+`--clients N` connects N scripted random-walk clients to the server and reports how it went.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tcod
+
+from data_classes.entity import Entity
+from data_classes.game_map import GameMap
+from data_classes.save_format import unpack_game_map
+from engine import Engine
+from generators.level_pregenerator import build_level
+from headless import MOVE_SYMS
+from input_handlers import EventHandler
+from main import LEVEL_SETTINGS, SCREEN_HEIGHT, SCREEN_WIDTH
+
+# One changed console cell.
+CELL_DT = np.dtype([("x", "<u2"), ("y", "<u2"), ("ch", "<i4"), ("fg", "u1", 3), ("bg", "u1", 3)])
+FRAME_HEADER = struct.Struct(">I")
+EMPTY_FRAME = FRAME_HEADER.pack(0)  # Answer to a batch that didn't change anything.
+
+
+class SharedLevel:
+    """A generated level that any number of sessions can be started on."""
+
+    def __init__(self, seed: int, depth: int = 1):
+        self.packed = build_level(seed, depth, LEVEL_SETTINGS)
+        self.template, _ = unpack_game_map(self.packed)
+        # Fill the tile property cache once, every session reuses it.
+        self.template.walkable
+        self.template.transparent
+
+    def new_session(self) -> Tuple[GameMap, Entity]:
+        """Return a fresh copy of the level's mutable state, sharing its tiles, and its player."""
+        return unpack_game_map(self.packed, shared=self.template)
+
+
+class Session:
+    """One game played over a connection, rendering into its own console and sending what changed."""
+
+    def __init__(self, level: SharedLevel):
+        game_map, player = level.new_session()
+        self.engine = Engine(event_handler=EventHandler(), game_map=game_map, player=player)
+        self.console = tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+        self.previous: Optional[np.ndarray] = None  # Console cells sent last frame
+
+    def handle_keys(self, keys: List[List[int]]) -> bool:
+        """Play a batch of key presses, returning True if the game changed."""
+        events = [tcod.event.KeyDown(scancode=0, sym=sym, mod=mod) for sym, mod in keys]
+        return self.engine.handle_events(events) > 0
+
+    def frame(self) -> bytes:
+        """Draw a frame and return the cells that changed since the last one, as a length-prefixed message."""
+        self.engine.draw(self.console)
+        # rgba has no padding between its fields, so whole cells can be compared as raw bytes.
+        rgba = self.console.rgba
+        if self.previous is None:
+            changed = np.ones(rgba.shape, dtype=bool)
+        else:
+            changed = rgba.view(f"V{rgba.dtype.itemsize}") != self.previous.view(f"V{rgba.dtype.itemsize}")
+        self.previous = rgba.copy()
+
+        xs, ys = np.nonzero(changed)
+        cells = np.empty(len(xs), dtype=CELL_DT)
+        cells["x"], cells["y"] = xs, ys
+        cells["ch"] = rgba["ch"][xs, ys]
+        cells["fg"] = rgba["fg"][xs, ys, :3]
+        cells["bg"] = rgba["bg"][xs, ys, :3]
+        payload = cells.tobytes()
+        return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class SessionHost:
+    """Runs a `Session` for every connection, all on one event loop."""
+
+    def __init__(self, level: SharedLevel):
+        self.level = level
+        self.sessions: Dict[int, Session] = {}
+        self._ids = iter(range(sys.maxsize))
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session_id = next(self._ids)
+        session = self.sessions[session_id] = Session(self.level)
+        try:
+            writer.write(session.frame())
+            await writer.drain()
+            while line := await reader.readline():
+                try:
+                    changed = session.handle_keys(json.loads(line)["keys"])
+                except SystemExit:  # The player pressed escape.
+                    break
+                writer.write(session.frame() if changed else EMPTY_FRAME)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.sessions[session_id]
+            writer.close()
+
+    async def serve(self, path: str) -> asyncio.AbstractServer:
+        return await asyncio.start_unix_server(self.handle_connection, path=path)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> np.ndarray:
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return np.frombuffer(await reader.readexactly(length), dtype=CELL_DT)
+
+
+async def random_walk_client(path: str, turns: int, seed: int, batch: int = 1) -> Dict[str, float]:
+    """Connect to the server at `path` and play a seeded random walk, keeping a copy of the screen up to date."""
+    rng = random.Random(seed)
+    screen = tcod.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+    reader, writer = await asyncio.open_unix_connection(path)
+    frames = cells = 0
+    try:
+        for turn in range(0, turns + 1, batch):
+            if turn:
+                keys = [[rng.choice(MOVE_SYMS), 0] for _ in range(batch)]
+                writer.write(json.dumps({"keys": keys}).encode() + b"\n")
+                await writer.drain()
+            frame = await read_frame(reader)
+            for field in ("ch", "fg", "bg"):
+                screen.rgb[field][frame["x"], frame["y"]] = frame[field]
+            frames += 1
+            cells += len(frame)
+    finally:
+        writer.close()
+    return {"frames": frames, "cells_per_frame": cells / frames}
+
+
+async def run_clients(path: str, seed: int, clients: int, turns: int) -> None:
+    host = SessionHost(SharedLevel(seed))
+    server = await host.serve(path)
+    async with server:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # The sessions' combat messages.
+            results = await asyncio.gather(*(random_walk_client(path, turns, seed + i) for i in range(clients)))
+        seconds = time.perf_counter() - start
+    frames = sum(result["frames"] for result in results)
+    print(json.dumps({
+        "clients": clients,
+        "frames": frames,
+        "frames_per_second": frames / seconds,
+        "cells_per_frame": sum(result["cells_per_frame"] for result in results) / clients,
+    }, indent=2))
+
+
+async def serve_forever(path: str, seed: int) -> None:
+    host = SessionHost(SharedLevel(seed))
+    server = await host.serve(path)
+    print(f"Serving on {path}")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Host many game sessions over a local socket.")
+    parser.add_argument("--socket", default=None, help="Path of the Unix socket to listen on.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the shared level.")
+    parser.add_argument("--clients", type=int, default=0, help="Run this many scripted clients against the server and exit.")
+    parser.add_argument("--turns", type=int, default=200, help="Turns each scripted client plays.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="flamingos-server-") as directory:
+        path = args.socket or os.path.join(directory, "server.sock")
+        if args.clients:
+            asyncio.run(run_clients(path, args.seed, args.clients, args.turns))
+        else:
+            asyncio.run(serve_forever(path, args.seed))
+
+
+if __name__ == "__main__":
+    main()
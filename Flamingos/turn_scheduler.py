@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from data_classes.entity import Entity
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from data_classes.game_map import GameMap
+
+ACTION_COST = 100  # Energy one action costs, an entity with speed 100 acts once per ACTION_COST ticks.
+
+
+def action_delay(entity: Entity) -> int:
+    """Return the number of ticks `entity` needs to gather the energy for one action."""
+    return max(ACTION_COST * ACTION_COST // max(entity.speed, 1), 1)
+
+
+class TurnScheduler:
+    """Energy based turn order for the monsters near the player.
+
+    Only entities within `activation_radius` tiles of the player, or in the players FOV,
+    are woken and put on the heap. Entities that fall out of range go dormant when their
+    turn comes up, so a turn costs time for the active monsters only.
+    """
+
+    def __init__(self, activation_radius: int = 20):
+        self.activation_radius = activation_radius
+        self.time = 0
+        self.queue: List[Tuple[int, int, Entity]] = []  # (tick of the next action, tie breaker, entity)
+        self.active: Set[Entity] = set()
+        self._order = itertools.count()
+        self._last_wake: Optional[Tuple[Tuple[int, int, int, int], GameMap]] = None  # Area searched last
+
+    def reset(self) -> None:
+        """Forget all scheduled entities, for example after changing maps."""
+        self.queue.clear()
+        self.active.clear()
+        self._last_wake = None
+
+    def is_awake(self, entity: Entity, game_map: GameMap, player: Entity) -> bool:
+        return (
+            max(abs(entity.x - player.x), abs(entity.y - player.y)) <= self.activation_radius
+            or bool(game_map.visible[entity.x, entity.y])
+        )
+
+    def schedule(self, entity: Entity, time: int) -> None:
+        heapq.heappush(self.queue, (time, next(self._order), entity))
+
+    def wake(self, engine: Engine, force: bool = False) -> None:
+        """Activate the dormant entities within the activation radius or the FOV.
+
+        Dormant entities don't move, so after a step only the strips that came into range are
+        searched. `force` searches the whole area again, for entities placed there since.
+        """
+        game_map, player = engine.game_map, engine.player
+        x_slice, y_slice = game_map.window_around(player.x, player.y, self.activation_radius)
+        fov_x, fov_y = game_map.visible_window
+        area = (
+            min(x_slice.start, fov_x.start),
+            min(y_slice.start, fov_y.start),
+            max(x_slice.stop, fov_x.stop),
+            max(y_slice.stop, fov_y.stop),
+        )
+        # Everything in the searched area is awake, unless the FOV reaches past the activation radius.
+        fully_awake = area == (x_slice.start, y_slice.start, x_slice.stop, y_slice.stop)
+
+        last = self._last_wake
+        self._last_wake = (area, game_map) if fully_awake else None
+        if force or last is None or last[1] is not game_map:
+            self._wake_area(engine, *area)
+            return
+
+        x1, y1, x2, y2 = area
+        old_x1, old_y1, old_x2, old_y2 = last[0]
+        keep_x1, keep_x2 = max(x1, old_x1), min(x2, old_x2)
+        keep_y1, keep_y2 = max(y1, old_y1), min(y2, old_y2)
+        if keep_x1 >= keep_x2 or keep_y1 >= keep_y2:
+            self._wake_area(engine, *area)
+            return
+        self._wake_area(engine, x1, y1, keep_x1, y2)
+        self._wake_area(engine, keep_x2, y1, x2, y2)
+        self._wake_area(engine, keep_x1, y1, keep_x2, keep_y1)
+        self._wake_area(engine, keep_x1, keep_y2, keep_x2, y2)
+
+    def _wake_area(self, engine: Engine, x1: int, y1: int, x2: int, y2: int) -> None:
+        game_map, player = engine.game_map, engine.player
+        if x1 >= x2 or y1 >= y2:
+            return
+        store = game_map.entity_store
+        occupants = game_map.occupants[x1:x2, y1:y2]
+        # Tile by tile, x then y. Handles are only made for the entities that wake up.
+        for row in occupants[occupants >= 0].tolist():
+            while row >= 0:
+                entity = store.handles[row]
+                if entity is not player and (entity is None or entity not in self.active):
+                    x, y = int(store.x[row]), int(store.y[row])
+                    if max(abs(x - player.x), abs(y - player.y)) <= self.activation_radius or game_map.visible[x, y]:
+                        entity = Entity.for_row(store, row)
+                        self.active.add(entity)
+                        self.schedule(entity, self.time + action_delay(entity))
+                row = int(store.next_at[row])
+
+    def advance(self, engine: Engine) -> Iterator[Entity]:
+        """Let the time of one player action pass, yielding every entity whose turn comes up, in order."""
+        self.wake(engine)
+        self.time += action_delay(engine.player)
+
+        while self.queue and self.queue[0][0] <= self.time:
+            time, _, entity = heapq.heappop(self.queue)
+            if entity.gamemap is not engine.game_map or not self.is_awake(entity, engine.game_map, engine.player):
+                self.active.discard(entity)  # Removed from the map or out of range, goes dormant.
+                continue
+            yield entity
+            self.schedule(entity, time + action_delay(entity))